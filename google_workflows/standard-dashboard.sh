@@ -31,12 +31,14 @@ Usage: ./standard_dashboard.sh
 	[ -i | --input-tar-file ] the tar file given to the script by the Google Trigger
   [ -k | --skip-bq-load ] skips the bq load step. available options: true or false
   [ -x | --helix ] apply Helix-specific changes. available options: true or false
+  [ -e | --snapshot ] the path in the mounted directory of the cumulative Terra table snapshot; replaces the full Terra table export ("/data/snapshot.tsv")
+  [ -c | --reconcile ] re-export the full Terra table to reconcile the snapshot. available options: true or false
 Happy dashboarding!
 EOF
 }
 
 # use getopt to parse the input arguments
-PARSED_ARGUMENTS=$(getopt -n "standard-dashboard" -o "hvd:s:b:o:t:g:r:p:w:q:m:i:k:x:" -l "version,help,dashboard-gcp-uri:,dashboard-schema:,gisaid-backup-dir:,output-dir:,trigger-bucket:,terra-gcp-uri:,terra-table-root-entity:,terra-project:,terra-workspace:,big-query-table-name:,puerto-rico:,input-tar-file:,skip-bq-load:,helix:" -a -- "$@")
+PARSED_ARGUMENTS=$(getopt -n "standard-dashboard" -o "hvd:s:b:o:t:g:r:p:w:q:m:i:k:x:e:c:" -l "version,help,dashboard-gcp-uri:,dashboard-schema:,gisaid-backup-dir:,output-dir:,trigger-bucket:,terra-gcp-uri:,terra-table-root-entity:,terra-project:,terra-workspace:,big-query-table-name:,puerto-rico:,input-tar-file:,skip-bq-load:,helix:,snapshot:,reconcile:" -a -- "$@")
 eval set -- "$PARSED_ARGUMENTS"
 
 while true; do
@@ -73,6 +75,10 @@ while true; do
       skip_bq_load=$2; shift 2;;
     -x|--helix)
       helix=$2; shift 2;;
+    -e|--snapshot)
+      snapshot=$2; shift 2;;
+    -c|--reconcile)
+      reconcile=$2; shift 2;;
     --) shift; break ;;
       *) echo "Unexpected option: $1 -- this should not happen."; exit 1;;
   esac
@@ -122,104 +128,27 @@ if [[ "$file" == *"gisaid_auspice_input"*"tar" ]]; then
   # set up gisaid processing directory using the current date
   gisaid_dir="${output_dir}/gisaid_processing/${date_tag}"
 
-  # establish google auth token
-  TOKEN=`gcloud auth print-access-token`
-
-  # run the following compilation of scripts:
-  SCRIPTS="
-  # decompress gisaid input tar ball into specific date processing directory
-  \n
-  mkdir ${gisaid_dir}
-  \n
-  tar -xf ${gisaid_backup_dir}/${filename} -C ${gisaid_dir}
-  \n
-  \n
-  # Create individual fasta files from GISAID multifasta
-  \n
-  python3 /scripts/gisaid_multifasta_parser.py ${gisaid_dir}/*.sequences.fasta ${gisaid_dir} ${puerto_rico} ${helix}
-  \n
-  \n
-  # Deposit individual fasta files into Terra GCP bucket
-  \n
-  gsutil -m cp ${gisaid_dir}/individual_gisaid_assemblies_$(date -I)/*.fasta ${terra_gcp_uri}/uploads/gisaid_individual_assemblies_${date_tag}/
-  \n
-  \n
-  # Create and import Terra Data table containing GCP pointers to deposited assemblies
-  \n
-  /scripts/terra_table_from_gcp_assemblies.sh ${terra_gcp_uri}/uploads/gisaid_individual_assemblies_${date_tag} ${terra_project} ${terra_workspace} ${terra_table_root_entity} ${gisaid_dir} \".fasta\" ${date_tag}
-  \n
-  \n
-  # Capture, reformat, and prune GISAID metadata
-  \n
-  python3 /scripts/gisaid_metadata_cleanser.py ${gisaid_dir}/*.metadata.tsv ${gisaid_dir}/gisaid_metadata_${date_tag}.tsv ${terra_table_root_entity} ${puerto_rico} ${helix}
-  \n
-  \n
-  # Import formatted data table into Terra
-  \n
-  python3 /scripts/import_large_tsv/import_large_tsv.py --project ${terra_project} --workspace ${terra_workspace} --tsv ${gisaid_dir}/gisaid_metadata_${date_tag}.tsv
-  \n
-  \n
+  # run the dashboard pipeline stages in one process
+  pipeline_args="-i ${gisaid_backup_dir}/${filename} -o ${gisaid_dir} -t ${date_tag} -g ${terra_gcp_uri} -r ${terra_table_root_entity} -p ${terra_project} -w ${terra_workspace} -m ${puerto_rico} -x ${helix} -l ${output_dir}/automation_logs/dashboard-${date_tag}.log"
   if ${skip_bq_load} ; then
-  \n
-  # Make a set table
-  \n
-  /scripts/make_terra_set.sh ${terra_gcp_uri}/uploads/gisaid_individual_assemblies_${date_tag}/ ${terra_project} ${terra_workspace} ${terra_table_root_entity} ${gisaid_dir} \".fasta\" ${date_tag}
-  \n
-  \n
-  # Run TheiaCoV_FASTA on the set
-  \n
-  curl -X 'POST' \
-    \"https://api.firecloud.org/api/workspaces/${terra_project}/${terra_workspace}/submissions\" \
-    -H 'accept: */*' \
-    -H \"Authorization: Bearer ${TOKEN}\" \
-    -H 'Content-Type: application/json' \
-    -d '{
-    \"methodConfigurationNamespace\": \"${terra_project}\",
-    \"methodConfigurationName\": \"TheiaCoV_FASTA_PHB\",
-    \"entityType\": \"${terra_table_root_entity}_set\",
-    \"entityName\": \"${date_tag}-set\",
-    \"expression\": \"this.${terra_table_root_entity}s\",
-    \"useCallCache\": true,
-    \"deleteIntermediateOutputFiles\": false,
-    \"useReferenceDisks\": false,
-    \"memoryRetryMultiplier\": 1,
-    \"workflowFailureMode\": \"NoNewCalls\",
-    \"userComment\": \"${date_tag}-set automatically launched\"
-    }'
-  \n
-  \n
-  else 
-  # Capture the entire Terra data table as a tsv
-  \n
-  python3 /scripts/export_large_tsv/export_large_tsv.py --project ${terra_project} --workspace ${terra_workspace} --entity_type ${terra_table_root_entity} --tsv_filename ${gisaid_dir}/full_${terra_table_root_entity}_terra_table_${date_tag}.tsv
-  \n
-  \n
-  # Convert the local Terra table tsv into a newline json
-  \n
-  python3 /scripts/tsv_to_newline_json.py ${gisaid_dir}/full_${terra_table_root_entity}_terra_table_${date_tag}.tsv ${gisaid_dir}/${terra_table_root_entity}_${date_tag}
-  \n
-  \n
-  # Push newline json to the dashboard GCP bucket and backup folder
-  \n
-  gsutil cp ${gisaid_dir}/${terra_table_root_entity}_${date_tag}.json ${dashboard_gcp_uri}/${terra_table_root_entity}.json
-  \n
-  gsutil cp ${gisaid_dir}/${terra_table_root_entity}_${date_tag}.json ${output_dir}/backup_jsons/
-  \n
-  \n
-  # Load newline json to Big Query 
-  \n
-  bq load --ignore_unknown_values=true --replace=true --source_format=NEWLINE_DELIMITED_JSON ${big_query_table_name} ${dashboard_gcp_uri}/${terra_table_root_entity}.json ${dashboard_schema}
-  \n
+    # import the set table and run TheiaCoV_FASTA on the set
+    pipeline_args="${pipeline_args} -k"
+  else
+    # load the newline json to Big Query, from the local snapshot if one is kept
+    pipeline_args="${pipeline_args} -d ${dashboard_gcp_uri} -s ${dashboard_schema} -q ${big_query_table_name} -b ${output_dir}/backup_jsons/"
+    if [ -n "${snapshot}" ]; then
+      pipeline_args="${pipeline_args} -e ${snapshot}"
+    fi
+    if [ "${reconcile}" == true ]; then
+      pipeline_args="${pipeline_args} -c"
+    fi
   fi
-  \n
-  \n
-  "
-  # write the commands that will be run to the automation log
+
+  # write the command that will be run to the automation log
   echo -e "#### Capturing GISAID data into Dashboard (${date_tag}) ####\n" >> ${output_dir}/automation_logs/dashboard-${date_tag}.log
-  echo -e $SCRIPTS >> ${output_dir}/automation_logs/dashboard-${date_tag}.log
+  echo "python3 /scripts/dashboard_pipeline.py ${pipeline_args}" >> ${output_dir}/automation_logs/dashboard-${date_tag}.log
 
-  # run the scripts
-  echo -e $SCRIPTS | bash -x
+  python3 /scripts/dashboard_pipeline.py ${pipeline_args}
 
 else
   # display error message if the file is not a GISAID file
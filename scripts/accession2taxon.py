@@ -0,0 +1,98 @@
+#! /usr/bin/env python3
+
+"""
+Build and query the indexed accession to taxon companion of the TheiaViral
+SKANI database. The SQLite table is keyed by accession, so annotating SKANI
+hits only reads the rows that are looked up instead of the whole TSV.
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+
+logging.basicConfig(
+    level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+MAX_SQL_VARS = 900
+
+
+def build_acc2taxon_db(acc2taxon, db_path, acc2rep=None):
+    """Write an accession to taxon/representative SQLite table"""
+    if acc2rep is None:
+        acc2rep = {}
+    if os.path.isfile(db_path):
+        os.remove(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "CREATE TABLE acc2taxon ("
+            + "accession TEXT PRIMARY KEY, taxon TEXT, representative TEXT"
+            + ") WITHOUT ROWID"
+        )
+        conn.executemany(
+            "INSERT INTO acc2taxon VALUES (?, ?, ?)",
+            (
+                (acc, acc2taxon[acc], acc2rep.get(acc, acc))
+                for acc in sorted(acc2taxon.keys())
+            ),
+        )
+    conn.close()
+    return db_path
+
+
+def lookup_taxa(db_path, accessions, batch_size=MAX_SQL_VARS):
+    """Batch lookup of accessions, returning {accession: (taxon, representative)}.
+    Accessions absent from the table are omitted"""
+    accessions = list(dict.fromkeys(accessions))
+    acc2info = {}
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        for i in range(0, len(accessions), batch_size):
+            batch = accessions[i : i + batch_size]
+            query = (
+                "SELECT accession, taxon, representative FROM acc2taxon "
+                + f"WHERE accession IN ({', '.join('?' * len(batch))})"
+            )
+            for acc, taxon, rep in conn.execute(query, batch):
+                acc2info[acc] = (taxon, rep)
+    finally:
+        conn.close()
+    return acc2info
+
+
+def main():
+    usage = "Look up taxa for accessions in an accession2taxon SQLite database"
+    parser = argparse.ArgumentParser(description=usage)
+    parser.add_argument("-d", "--db", required=True, help="accession2taxon SQLite")
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="File of accessions or SKANI reference FASTA names, one per line (DEFAULT: stdin)",
+    )
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, "r") as infile:
+            accs = [x.strip() for x in infile if x.strip()]
+    else:
+        accs = [x.strip() for x in sys.stdin if x.strip()]
+    # SKANI reports reference FASTA paths named by accession
+    accs = [os.path.basename(x).replace(".fna", "") for x in accs]
+
+    acc2info = lookup_taxa(args.db, accs)
+    sys.stdout.write("#accession\ttaxon\trepresentative\n")
+    for acc in accs:
+        if acc in acc2info:
+            taxon, rep = acc2info[acc]
+            sys.stdout.write(f"{acc}\t{taxon}\t{rep}\n")
+        else:
+            logger.warning(f"{acc} not found in {args.db}")
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
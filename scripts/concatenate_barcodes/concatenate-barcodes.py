@@ -5,7 +5,10 @@ import logging
 import subprocess
 import tempfile
 import sys
+import re
+import errno
 import shutil
+from collections import defaultdict
 
 def parse_args():
     """Parse command line arguments"""
@@ -21,6 +24,7 @@ def parse_args():
     parser.add_argument("--gcp", action="store_true", help="Enable Google Cloud Storage mode")
     parser.add_argument("--temp_dir", default=None, help="Temporary directory for GCS files")
     parser.add_argument("--keep_temp_files", action="store_true", help="Keep temporary files after processing")
+    parser.add_argument("--classify_reads", action="store_true", help="Instead of concatenating, classify Illumina reads in input_dir as single-end, paired-end, or anomalous and move single-end reads to output_dir")
     return parser.parse_args()
 
 def is_gcs_path(path):
@@ -134,6 +138,107 @@ def handle_gcs_files(input_path, output_file, args):
             if args.verbose:
                 logging.debug("Removed temp directory: {}".format(temp_dir))
 
+def illumina_name_regex(file_extension=".fastq.gz"):
+    """Compile the standard Illumina filename pattern: <ID>_L001_R1_001<ext>"""
+    return re.compile(r"^(?P<id>.+)_L(?P<lane>\d{3})_R(?P<read>[12])_001" + re.escape(file_extension) + "$")
+
+def scan_reads(input_dir, file_extension=".fastq.gz"):
+    """Group the reads in a directory by sample ID in one scan.
+    Returns {ID: {lane: {read: filename}}} and filenames that could not be parsed"""
+    name_regex = illumina_name_regex(file_extension)
+    samples = defaultdict(lambda: defaultdict(dict))
+    unparsed = []
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith(file_extension):
+                continue
+            match = name_regex.match(entry.name)
+            if match is None:
+                unparsed.append(entry.name)
+            else:
+                samples[match.group("id")][match.group("lane")][match.group("read")] = entry.name
+    return samples, sorted(unparsed)
+
+def classify_layout(lanes):
+    """Classify a sample's {lane: {read: filename}} as SE, PE, multi-lane SE, or
+    anomalous. Only single-file samples are SE, as move-SE-reads.sh has always
+    left samples with more than one file in place"""
+    layouts = set("PE" if len(reads) == 2 else "SE" for reads in lanes.values())
+    if len(layouts) != 1:
+        return "anomalous"
+    layout = layouts.pop()
+    if layout == "SE" and len(lanes) > 1:
+        return "multi-lane SE"
+    return layout
+
+def move_files(moves):
+    """Apply (source, destination) moves as a batch of renames. Destinations are
+    checked before anything is moved"""
+    conflicts = [dest for src, dest in moves if os.path.exists(dest)]
+    if conflicts:
+        raise FileExistsError("Destination files already exist: {}".format(", ".join(conflicts)))
+    for src, dest in moves:
+        try:
+            os.rename(src, dest)
+        except OSError as e:
+            # renames are only atomic within a filesystem
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.move(src, dest)
+        logging.debug("Moved {} to {}".format(src, dest))
+
+def classify_reads(args):
+    """Move single-end samples' reads out of the input directory and summarize
+    the read layout of every sample"""
+    if os.path.realpath(args.input_dir) == os.path.realpath(args.output_dir):
+        logging.error("Output directory must differ from the input directory when classifying reads")
+        sys.exit(1)
+    samples, unparsed = scan_reads(args.input_dir, args.file_extension)
+    if not samples and not unparsed:
+        logging.error("There are no {} files in {}".format(args.file_extension, args.input_dir))
+        sys.exit(1)
+    if os.path.isdir(args.output_dir) and \
+        any(x.endswith(args.file_extension) for x in os.listdir(args.output_dir)):
+        logging.error("There are {} files in {}, please use another directory".format(args.file_extension, args.output_dir))
+        sys.exit(1)
+
+    layouts = {sample: classify_layout(lanes) for sample, lanes in samples.items()}
+    moves = []
+    for sample in sorted(samples):
+        if layouts[sample] == "SE":
+            for lane in sorted(samples[sample]):
+                for read_file in sorted(samples[sample][lane].values()):
+                    moves.append((os.path.join(args.input_dir, read_file),
+                                  os.path.join(args.output_dir, read_file)))
+
+    if args.dry_run:
+        for src, dest in moves:
+            logging.info("Dry run: would move {} to {}".format(src, dest))
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        move_files(moves)
+        with open(os.path.join(args.output_dir, "read_layout_summary.tsv"), "w") as summary:
+            summary.write("sample\tlayout\tfiles\n")
+            for sample in sorted(samples):
+                files = sorted(x for reads in samples[sample].values() for x in reads.values())
+                summary.write("{}\t{}\t{}\n".format(sample, layouts[sample], ",".join(files)))
+            for unparsed_file in unparsed:
+                summary.write("{}\tanomalous\t{}\n".format(unparsed_file, unparsed_file))
+
+    for sample in sorted(x for x in layouts if layouts[x] == "anomalous"):
+        logging.warning("Sample {} has an anomalous read layout: {}".format(sample, dict(samples[sample])))
+    for sample in sorted(x for x in layouts if layouts[x] == "multi-lane SE"):
+        logging.info("Sample {} is single-end across multiple lanes, leaving it in place".format(sample))
+    for unparsed_file in unparsed:
+        logging.warning("Could not parse an Illumina sample name from {}".format(unparsed_file))
+    counts = {layout: list(layouts.values()).count(layout)
+              for layout in ["PE", "SE", "multi-lane SE", "anomalous"]}
+    summary = "Samples: {} paired-end, {} single-end ({} files {}), {} multi-lane single-end (left in place), " \
+              "{} anomalous, {} unparsed files".format(
+        counts["PE"], counts["SE"], len(moves), "to move" if args.dry_run else "moved",
+        counts["multi-lane SE"], counts["anomalous"], len(unparsed))
+    logging.info(summary)
+
 def main():
     args = parse_args()
     
@@ -162,6 +267,13 @@ def main():
                     mapping[parts[0]] = parts[1]
                 logging.info("Loaded mapping: {} -> {}".format(parts[0], parts[1]))
 
+    if args.classify_reads:
+        if args.gcp:
+            logging.error("--classify_reads is incompatible with --gcp")
+            sys.exit(1)
+        classify_reads(args)
+        return
+
     if args.gcp:
         try:
             run_shell_cmd("gcloud storage --help", args.verbose)
@@ -0,0 +1,335 @@
+#! /usr/bin/env python3
+
+"""
+Run the GISAID dashboard pipeline in one process. The auspice tarball's
+sequences are exported to Terra while its metadata is cleaned and imported, and
+the results are passed in memory to the dashboard's BigQuery load or to the
+launch of TheiaCoV_FASTA on the new set. Each stage's run time is logged.
+"""
+
+import os
+import sys
+import glob
+import time
+import tarfile
+import logging
+import argparse
+import subprocess
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from gisaid_multifasta_parser import parse_multifasta, write_individual_fastas
+from gisaid_metadata_cleanser import read_metadata, clean_metadata
+from terra_table_from_gcp_assemblies import write_terra_tables
+from terra_import import import_tsvs, get_token, TERRA_API
+from dashboard_snapshot import read_tsv, merge_rows, write_snapshot, snapshot_rows
+from tsv_to_newline_json import write_newline_json
+
+logging.basicConfig(
+    level=logging.DEBUG,
+    format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+EXPORT_SCRIPT = "/scripts/export_large_tsv/export_large_tsv.py"
+
+
+def stage(func):
+    """Log a pipeline stage's run time"""
+
+    @wraps(func)
+    def timed(*args, **kwargs):
+        logger.info(f"Starting {func.__name__}")
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            logger.info(
+                f"Finished {func.__name__} in {time.perf_counter() - start:.1f}s"
+            )
+
+    return timed
+
+
+@stage
+def extract_tarball(tar_path, gisaid_dir):
+    """Extract the auspice tarball, returning its sequences and metadata paths"""
+    os.makedirs(gisaid_dir, exist_ok=True)
+    with tarfile.open(tar_path) as tar:
+        tar.extractall(gisaid_dir)
+    paths = []
+    for pattern in ["*.sequences.fasta", "*.metadata.tsv"]:
+        matches = glob.glob(os.path.join(gisaid_dir, pattern))
+        if not matches:
+            raise FileNotFoundError(f"ERROR: {tar_path} does not contain {pattern}")
+        paths.append(matches[0])
+    return tuple(paths)
+
+
+@stage
+def parse_sequences(sequences, gisaid_dir, puertorico, helix):
+    """Split the multifasta into individual assemblies, returning their names"""
+    with parse_multifasta(sequences, puertorico, helix) as records:
+        fasta_dir = write_individual_fastas(records, gisaid_dir)
+        return list(records.keys()), fasta_dir
+
+
+@stage
+def upload_assemblies(fasta_dir, names, assembly_uri):
+    """Copy the assemblies to the Terra bucket with one gsutil call"""
+    fastas = "".join(f"{os.path.join(fasta_dir, x)}.fasta\n" for x in names)
+    subprocess.run(
+        ["gsutil", "-m", "cp", "-I", f"{assembly_uri}/"],
+        input=fastas,
+        text=True,
+        check=True,
+    )
+    return [f"{assembly_uri}/{x}.fasta" for x in names]
+
+
+@stage
+def build_terra_tables(assemblies, root_entity, gisaid_dir, date_tag):
+    """Write the assembly entity and set tables from the uploaded assemblies"""
+    entity_tsv = os.path.join(gisaid_dir, f"assembly_terra_table_{date_tag}.tsv")
+    set_tsv = os.path.join(gisaid_dir, f"{date_tag}-set.tsv")
+    rows = write_terra_tables(
+        assemblies,
+        root_entity,
+        entity_tsv,
+        set_tsv,
+        f"{date_tag}-set",
+        delimiter=".fasta",
+        upload_set=date_tag,
+    )
+    return entity_tsv, set_tsv, rows
+
+
+@stage
+def import_tables(tsvs, terra_project, terra_workspace):
+    """Import TSVs into Terra in order. import_tsvs fetches a fresh token, as
+    access tokens expire during long runs"""
+    import_tsvs(tsvs, terra_project, terra_workspace)
+
+
+def sequence_branch(args):
+    """Export sequences: parse, upload, and import the assembly table"""
+    names, fasta_dir = parse_sequences(
+        args.sequences, args.gisaid_dir, args.puertorico, args.helix
+    )
+    assembly_uri = (
+        f"{args.terra_gcp_uri.rstrip('/')}/uploads/"
+        + f"gisaid_individual_assemblies_{args.date_tag}"
+    )
+    assemblies = upload_assemblies(fasta_dir, names, assembly_uri)
+    entity_tsv, set_tsv, rows = build_terra_tables(
+        assemblies, args.root_entity, args.gisaid_dir, args.date_tag
+    )
+    import_tables([entity_tsv], args.terra_project, args.terra_workspace)
+    return set_tsv, rows
+
+
+@stage
+def clean_gisaid_metadata(metadata, root_entity, puertorico, helix, meta_tsv):
+    """Clean the metadata, writing its Terra table and returning the DataFrame"""
+    meta_df = clean_metadata(read_metadata(metadata), root_entity, puertorico, helix)
+    meta_df.to_csv(meta_tsv, sep="\t", index=False)
+    return meta_df
+
+
+def metadata_branch(args):
+    """Clean the metadata and import it"""
+    meta_tsv = os.path.join(args.gisaid_dir, f"gisaid_metadata_{args.date_tag}.tsv")
+    meta_df = clean_gisaid_metadata(
+        args.metadata, args.root_entity, args.puertorico, args.helix, meta_tsv
+    )
+    import_tables([meta_tsv], args.terra_project, args.terra_workspace)
+    return meta_df
+
+
+@stage
+def launch_theiacov(args):
+    """Launch TheiaCoV_FASTA_PHB on the new set"""
+    response = requests.post(
+        f"{TERRA_API}/workspaces/{args.terra_project}/{args.terra_workspace}/submissions",
+        headers={"Authorization": f"Bearer {get_token()}", "accept": "*/*"},
+        json={
+            "methodConfigurationNamespace": args.terra_project,
+            "methodConfigurationName": "TheiaCoV_FASTA_PHB",
+            "entityType": f"{args.root_entity}_set",
+            "entityName": f"{args.date_tag}-set",
+            "expression": f"this.{args.root_entity}s",
+            "useCallCache": True,
+            "deleteIntermediateOutputFiles": False,
+            "useReferenceDisks": False,
+            "memoryRetryMultiplier": 1,
+            "workflowFailureMode": "NoNewCalls",
+            "userComment": f"{args.date_tag}-set automatically launched",
+        },
+    )
+    response.raise_for_status()
+
+
+@stage
+def snapshot_newline_json(args, assembly_rows, meta_df, json_name):
+    """Merge the new tables into the snapshot and write the newline JSON from it"""
+    snapshot_header, snapshot = read_tsv(args.snapshot)
+    entity_id = f"entity:{args.root_entity}_id"
+    merge_rows(
+        snapshot_header,
+        snapshot,
+        [entity_id, "assembly_fasta", "terra_upload_set"],
+        {x[0]: {"assembly_fasta": x[1], "terra_upload_set": x[2]} for x in assembly_rows},
+        "assembly table",
+    )
+    meta_columns = [entity_id] + [str(x) for x in meta_df.columns if x != entity_id]
+    meta_rows = {}
+    for values in meta_df[meta_columns].astype(str).itertuples(index=False):
+        meta_rows[values[0]] = dict(zip(meta_columns[1:], values[1:]))
+    merge_rows(snapshot_header, snapshot, meta_columns, meta_rows, "metadata")
+    write_snapshot(snapshot_header, snapshot, args.snapshot)
+    write_newline_json(snapshot_header, snapshot_rows(snapshot_header, snapshot), json_name)
+
+
+@stage
+def export_newline_json(args, json_name):
+    """Export the full Terra table and write the newline JSON from it, reconciling
+    the snapshot if one is kept"""
+    export_tsv = os.path.join(
+        args.gisaid_dir, f"full_{args.root_entity}_terra_table_{args.date_tag}.tsv"
+    )
+    subprocess.run(
+        [
+            "python3",
+            args.export_script,
+            "--project",
+            args.terra_project,
+            "--workspace",
+            args.terra_workspace,
+            "--entity_type",
+            args.root_entity,
+            "--tsv_filename",
+            export_tsv,
+        ],
+        check=True,
+    )
+    snapshot_header, snapshot = read_tsv(export_tsv)
+    if args.snapshot:
+        write_snapshot(snapshot_header, snapshot, args.snapshot)
+    write_newline_json(snapshot_header, snapshot_rows(snapshot_header, snapshot), json_name)
+
+
+@stage
+def load_big_query(args, json_name):
+    """Push the newline JSON to the dashboard bucket and backup, then load it to BigQuery"""
+    dashboard_json = f"{args.dashboard_gcp_uri.rstrip('/')}/{args.root_entity}.json"
+    subprocess.run(["gsutil", "cp", f"{json_name}.json", dashboard_json], check=True)
+    if args.backup_dir:
+        subprocess.run(
+            ["gsutil", "cp", f"{json_name}.json", f"{args.backup_dir.rstrip('/')}/"],
+            check=True,
+        )
+    subprocess.run(
+        [
+            "bq",
+            "load",
+            "--ignore_unknown_values=true",
+            "--replace=true",
+            "--source_format=NEWLINE_DELIMITED_JSON",
+            args.big_query_table,
+            dashboard_json,
+            args.dashboard_schema,
+        ],
+        check=True,
+    )
+
+
+def run_pipeline(args):
+    # fail before the long stages if Terra credentials are unavailable
+    get_token()
+    if args.tar:
+        args.sequences, args.metadata = extract_tarball(args.tar, args.gisaid_dir)
+
+    # Sequence export and metadata cleaning are independent until the load
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="branch") as executor:
+        sequences = executor.submit(sequence_branch, args)
+        metadata = executor.submit(metadata_branch, args)
+        set_tsv, assembly_rows = sequences.result()
+        meta_df = metadata.result()
+
+    if args.skip_bq_load:
+        import_tables([set_tsv], args.terra_project, args.terra_workspace)
+        launch_theiacov(args)
+        return
+
+    json_name = os.path.join(args.gisaid_dir, f"{args.root_entity}_{args.date_tag}")
+    if args.snapshot and os.path.isfile(args.snapshot) and not args.reconcile:
+        snapshot_newline_json(args, assembly_rows, meta_df, json_name)
+    else:
+        export_newline_json(args, json_name)
+    load_big_query(args, json_name)
+
+
+def main():
+    usage = "Run the GISAID dashboard pipeline on an auspice tarball"
+    parser = argparse.ArgumentParser(description=usage)
+    parser.add_argument("-i", "--tar", help="GISAID auspice input tarball")
+    parser.add_argument("--sequences", help="Extracted sequences FASTA instead of -i")
+    parser.add_argument("--metadata", help="Extracted metadata TSV instead of -i")
+    parser.add_argument(
+        "-o", "--gisaid_dir", required=True, help="Processing directory for this run"
+    )
+    parser.add_argument(
+        "-t",
+        "--date_tag",
+        default=time.strftime("%Y-%m-%d-%Hh-%Mm-%Ss"),
+        help="Run tag for uploads, tables, and the set name",
+    )
+    parser.add_argument("-g", "--terra_gcp_uri", required=True, help="Terra bucket")
+    parser.add_argument("-r", "--root_entity", required=True, help="Terra table")
+    parser.add_argument("-p", "--terra_project", required=True)
+    parser.add_argument("-w", "--terra_workspace", required=True)
+    parser.add_argument("-m", "--puertorico", default="false", help="true or false")
+    parser.add_argument("-x", "--helix", default="false", help="true or false")
+    parser.add_argument(
+        "-k",
+        "--skip_bq_load",
+        action="store_true",
+        help="Import the set and launch TheiaCoV_FASTA_PHB instead of loading BigQuery",
+    )
+    parser.add_argument("-d", "--dashboard_gcp_uri", help="Dashboard bucket")
+    parser.add_argument("-s", "--dashboard_schema", help="BigQuery schema")
+    parser.add_argument("-q", "--big_query_table", help="BigQuery table")
+    parser.add_argument("-b", "--backup_dir", help="Newline JSON backup directory/URI")
+    parser.add_argument(
+        "-e", "--snapshot", help="Cumulative Terra table snapshot TSV; see dashboard_snapshot.py"
+    )
+    parser.add_argument(
+        "-c",
+        "--reconcile",
+        action="store_true",
+        help="Export the full Terra table and reconcile the snapshot",
+    )
+    parser.add_argument("--export_script", default=EXPORT_SCRIPT, help=f"DEFAULT: {EXPORT_SCRIPT}")
+    parser.add_argument("-l", "--log_file", help="Also append the log to this file")
+    args = parser.parse_args()
+
+    if not args.tar and not (args.sequences and args.metadata):
+        raise AttributeError("ERROR: -i or --sequences and --metadata required")
+    if not args.skip_bq_load and not (
+        args.dashboard_gcp_uri and args.dashboard_schema and args.big_query_table
+    ):
+        raise AttributeError("ERROR: -d, -s, and -q are required to load BigQuery")
+    if args.log_file:
+        handler = logging.FileHandler(args.log_file)
+        handler.setFormatter(logging.getLogger().handlers[0].formatter)
+        logging.getLogger().addHandler(handler)
+
+    start = time.perf_counter()
+    run_pipeline(args)
+    logger.info(f"Pipeline finished in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
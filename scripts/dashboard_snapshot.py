@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+
+"""
+Maintain a local cumulative snapshot of a dashboard's Terra table and emit the
+BigQuery newline JSON from it. Each run's cleaned TSVs are merged into the
+snapshot by sample ID, so the full Terra table only needs to be exported to
+periodically reconcile the snapshot.
+"""
+
+import os
+import sys
+import logging
+import argparse
+from tsv_to_newline_json import write_newline_json
+
+logging.basicConfig(
+    level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+def read_tsv(tsv):
+    """Read a TSV into its header and {sample ID: {column: value}}"""
+    rows = {}
+    with open(tsv, "r") as raw:
+        header = raw.readline().rstrip("\n").split("\t")
+        for line in raw:
+            if not line.strip():
+                continue
+            values = line.rstrip("\n").split("\t")
+            rows[values[0]] = dict(zip(header[1:], values[1:]))
+    return header, rows
+
+
+def merge_tsv(snapshot_header, snapshot, tsv):
+    """Merge a TSV's rows into the snapshot by sample ID"""
+    header, rows = read_tsv(tsv)
+    return merge_rows(snapshot_header, snapshot, header, rows, tsv)
+
+
+def merge_rows(snapshot_header, snapshot, header, rows, source="table"):
+    """Merge {sample ID: {column: value}} rows into the snapshot, updating the
+    columns they have and appending new columns. Returns the number of new samples"""
+    if not snapshot_header:
+        snapshot_header.append(header[0])
+    for column in header[1:]:
+        if column not in snapshot_header:
+            snapshot_header.append(column)
+    new_samples = 0
+    for sample, values in rows.items():
+        if sample not in snapshot:
+            snapshot[sample] = {}
+            new_samples += 1
+        snapshot[sample].update(values)
+    logger.info(f"Merged {len(rows)} samples ({new_samples} new) from {source}")
+    return new_samples
+
+
+def snapshot_rows(snapshot_header, snapshot):
+    """Yield the snapshot as rows of values, with missing values empty"""
+    for sample, values in snapshot.items():
+        yield [sample] + [values.get(x, "") for x in snapshot_header[1:]]
+
+
+def write_snapshot(snapshot_header, snapshot, snapshot_path):
+    """Atomically write the snapshot TSV"""
+    with open(snapshot_path + ".tmp", "w") as out:
+        out.write("\t".join(snapshot_header) + "\n")
+        for row in snapshot_rows(snapshot_header, snapshot):
+            out.write("\t".join(row) + "\n")
+    os.replace(snapshot_path + ".tmp", snapshot_path)
+
+
+def main():
+    usage = "Merge cleaned TSVs into a cumulative snapshot and write newline JSON from it"
+    parser = argparse.ArgumentParser(description=usage)
+    parser.add_argument("-s", "--snapshot", required=True, help="Snapshot TSV")
+    parser.add_argument(
+        "-t", "--tsv", nargs="+", default=[], help="TSVs to merge by sample ID, in order"
+    )
+    parser.add_argument(
+        "-r",
+        "--reconcile",
+        help="Full Terra table export that replaces the snapshot before merging",
+    )
+    parser.add_argument(
+        "-o", "--output_name", required=True, help="Newline JSON output name (no .json)"
+    )
+    args = parser.parse_args()
+
+    if args.reconcile:
+        logger.info(f"Reconciling the snapshot with {args.reconcile}")
+        snapshot_header, snapshot = read_tsv(args.reconcile)
+    elif os.path.isfile(args.snapshot):
+        snapshot_header, snapshot = read_tsv(args.snapshot)
+    else:
+        raise FileNotFoundError(
+            f"ERROR: {args.snapshot} does not exist; initialize it with -r"
+        )
+
+    for tsv in args.tsv:
+        merge_tsv(snapshot_header, snapshot, tsv)
+    write_snapshot(snapshot_header, snapshot, args.snapshot)
+    write_newline_json(
+        snapshot_header, snapshot_rows(snapshot_header, snapshot), args.output_name
+    )
+    logger.info(f"Wrote {len(snapshot)} samples to {args.output_name}.json")
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
@@ -0,0 +1,322 @@
+#! /usr/bin/env python3
+
+"""
+Watch a directory for GISAID auspice tarballs and run the dashboard pipeline on
+each. Files are queued once their size is stable, duplicates are skipped by
+content hash, and tarballs are processed with bounded concurrency. Tarballs
+already present at startup are skipped unless backfilling. Queue depth and
+processing latency are logged and written to a metrics JSON.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import fnmatch
+import hashlib
+import logging
+import argparse
+import threading
+import subprocess
+
+logging.basicConfig(
+    level=logging.DEBUG,
+    format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's contents"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as raw:
+        for chunk in iter(lambda: raw.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class DashboardWatcher:
+    """Poll a directory, queueing files matching a pattern once their size and
+    modification time are unchanged for `stable_polls` polls. `handler(path,
+    content_hash)` is called on queued files from `workers` threads. Files
+    present at startup are ignored unless `backfill` is set"""
+
+    def __init__(
+        self,
+        watch_dir,
+        handler,
+        pattern="gisaid_auspice_input*tar",
+        workers=1,
+        poll_interval=10,
+        stable_polls=2,
+        state_file=None,
+        metrics_file=None,
+        backfill=False,
+    ):
+        self.watch_dir = watch_dir
+        self.handler = handler
+        self.pattern = pattern
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stable_polls = stable_polls
+        self.state_file = state_file
+        self.metrics_file = metrics_file
+        self.backfill = backfill
+        self.queue = queue.Queue()
+        self.pending = {}
+        self.queued = set()
+        self.seen_hashes = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.metrics = {
+            "queued": 0,
+            "in_progress": 0,
+            "processed": 0,
+            "failed": 0,
+            "duplicates": 0,
+            "last_latency_s": None,
+            "max_latency_s": 0.0,
+            "total_latency_s": 0.0,
+        }
+        if state_file and os.path.isfile(state_file):
+            with open(state_file, "r") as raw:
+                self.seen_hashes = set(json.load(raw))
+
+    def save_state(self):
+        """Persist processed content hashes so restarts skip them"""
+        if not self.state_file:
+            return
+        with self.lock:
+            hashes = sorted(self.seen_hashes)
+        with open(self.state_file + ".tmp", "w") as out:
+            json.dump(hashes, out)
+        os.replace(self.state_file + ".tmp", self.state_file)
+
+    def get_metrics(self):
+        """Snapshot of the counters, queue depth, and latencies"""
+        with self.lock:
+            metrics = dict(self.metrics)
+        metrics["queue_depth"] = self.queue.qsize()
+        finished = metrics["processed"] + metrics["failed"]
+        metrics["mean_latency_s"] = (
+            metrics["total_latency_s"] / finished if finished else None
+        )
+        return metrics
+
+    def write_metrics(self):
+        if not self.metrics_file:
+            return
+        with open(self.metrics_file + ".tmp", "w") as out:
+            json.dump(self.get_metrics(), out, indent=2)
+        os.replace(self.metrics_file + ".tmp", self.metrics_file)
+
+    def skip_existing(self):
+        """Treat the files already present as seen, as they predate the watcher.
+        They are considered anew only if removed and replaced"""
+        with os.scandir(self.watch_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and fnmatch.fnmatch(entry.name, self.pattern):
+                    self.queued.add(entry.path)
+        logger.info(
+            f"Skipping {len(self.queued)} existing files in {self.watch_dir}; "
+            + "use backfill to process them"
+        )
+
+    def poll_once(self):
+        """Scan the directory once, queueing files whose size has settled"""
+        present = set()
+        with os.scandir(self.watch_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not fnmatch.fnmatch(entry.name, self.pattern):
+                    continue
+                present.add(entry.path)
+                if entry.path in self.queued:
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime_ns)
+                last_signature, polls = self.pending.get(entry.path, (None, 0))
+                polls = polls + 1 if signature == last_signature else 0
+                self.pending[entry.path] = (signature, polls)
+                if polls >= self.stable_polls:
+                    self.enqueue(entry.path)
+        # forget files that were removed, so a replacement is considered anew
+        for path in set(self.pending).difference(present):
+            del self.pending[path]
+        self.queued.intersection_update(present)
+
+    def enqueue(self, path):
+        """Queue a settled file unless its contents were already processed"""
+        del self.pending[path]
+        self.queued.add(path)
+        content_hash = file_hash(path)
+        with self.lock:
+            if content_hash in self.seen_hashes:
+                self.metrics["duplicates"] += 1
+                logger.info(f"Skipping {path}: contents already processed")
+                return
+            self.seen_hashes.add(content_hash)
+            self.metrics["queued"] += 1
+        logger.info(f"Queued {path} (queue depth {self.queue.qsize() + 1})")
+        self.queue.put((path, content_hash, time.monotonic()))
+
+    def work(self):
+        """Process queued files until stopped"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            path, content_hash, queued_at = item
+            with self.lock:
+                self.metrics["in_progress"] += 1
+            start = time.monotonic()
+            try:
+                self.handler(path, content_hash)
+                outcome = "processed"
+            except Exception:
+                logger.exception(f"Failed to process {path}")
+                outcome = "failed"
+                # allow the same contents to be retried if they are resubmitted
+                with self.lock:
+                    self.seen_hashes.discard(content_hash)
+            latency = time.monotonic() - queued_at
+            with self.lock:
+                self.metrics["in_progress"] -= 1
+                self.metrics[outcome] += 1
+                self.metrics["last_latency_s"] = latency
+                self.metrics["max_latency_s"] = max(self.metrics["max_latency_s"], latency)
+                self.metrics["total_latency_s"] += latency
+            logger.info(
+                f"{outcome.capitalize()} {path} in {time.monotonic() - start:.1f}s "
+                + f"({latency:.1f}s since queued)"
+            )
+            self.save_state()
+            self.queue.task_done()
+
+    def start(self):
+        """Start the worker threads"""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"worker_{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, wait=True):
+        """Stop polling and let the workers finish the queue"""
+        self.stopped.set()
+        for _ in self.threads:
+            self.queue.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+        self.save_state()
+        self.write_metrics()
+
+    def run(self):
+        """Poll until stopped"""
+        if not self.backfill:
+            self.skip_existing()
+        self.start()
+        logger.info(f"Watching {self.watch_dir} for {self.pattern}")
+        while not self.stopped.is_set():
+            try:
+                self.poll_once()
+            except OSError:
+                logger.exception(f"Failed to scan {self.watch_dir}")
+            metrics = self.get_metrics()
+            logger.debug(
+                f"Queue depth {metrics['queue_depth']}, in progress {metrics['in_progress']}"
+            )
+            self.write_metrics()
+            self.stopped.wait(self.poll_interval)
+
+
+def pipeline_handler(output_dir, pipeline_args, pipeline="dashboard_pipeline.py"):
+    """Handler running the dashboard pipeline on a tarball in its own directory"""
+
+    def handler(path, content_hash):
+        date_tag = time.strftime("%Y-%m-%d-%Hh-%Mm-%Ss") + f"_{content_hash[:8]}"
+        gisaid_dir = os.path.join(output_dir, "gisaid_files", date_tag)
+        # in its own session, so signals to the watcher don't interrupt the run
+        subprocess.run(
+            [sys.executable, pipeline, "-i", path, "-o", gisaid_dir, "-t", date_tag]
+            + pipeline_args,
+            check=True,
+            start_new_session=True,
+        )
+
+    return handler
+
+
+def main():
+    usage = "Watch a directory for GISAID auspice tarballs and run the dashboard pipeline. " \
+        + "Arguments after -- are passed to dashboard_pipeline.py"
+    parser = argparse.ArgumentParser(description=usage)
+    parser.add_argument("-w", "--watch_dir", required=True, help="Directory to watch")
+    parser.add_argument(
+        "-o", "--output_dir", required=True, help="Output directory for runs, state, and logs"
+    )
+    parser.add_argument(
+        "-p",
+        "--pattern",
+        default="gisaid_auspice_input*tar",
+        help='DEFAULT: "gisaid_auspice_input*tar"',
+    )
+    parser.add_argument(
+        "-c", "--workers", type=int, default=1, help="Concurrent pipeline runs; DEFAULT: 1"
+    )
+    parser.add_argument(
+        "-i", "--interval", type=float, default=10, help="Seconds between polls; DEFAULT: 10"
+    )
+    parser.add_argument(
+        "-s",
+        "--stable_polls",
+        type=int,
+        default=2,
+        help="Polls a file's size must be unchanged before it is queued; DEFAULT: 2",
+    )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="Also process tarballs already in the watch directory at startup",
+    )
+    parser.add_argument(
+        "--pipeline",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard_pipeline.py"),
+        help="dashboard_pipeline.py path",
+    )
+    parser.add_argument("pipeline_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    pipeline_args = args.pipeline_args
+    if pipeline_args and pipeline_args[0] == "--":
+        pipeline_args = pipeline_args[1:]
+    log_dir = os.path.join(args.output_dir, "automation_logs")
+    os.makedirs(log_dir, exist_ok=True)
+    watcher = DashboardWatcher(
+        args.watch_dir,
+        pipeline_handler(args.output_dir, pipeline_args, args.pipeline),
+        pattern=args.pattern,
+        workers=args.workers,
+        poll_interval=args.interval,
+        stable_polls=args.stable_polls,
+        state_file=os.path.join(args.output_dir, "processed_hashes.json"),
+        metrics_file=os.path.join(log_dir, "watcher_metrics.json"),
+        backfill=args.backfill,
+    )
+    # stop polling on SIGTERM, e.g. from the service manager
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stopped.set())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    # drain the queue and save the processed hashes
+    logger.info("Stopping; waiting for queued tarballs to finish")
+    watcher.stop()
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 
 import argparse
-import pyfaidx
+import array
+import mmap
 import time
 import os
 import sys
@@ -19,51 +20,111 @@ def get_opts():
                 help='perform Helix-specific functions.')
     args = p.parse_args()
     return args
-arguments = get_opts()
-
-fasta1 = arguments.gisaid_multifasta_file
-output_dir_loc = arguments.output_dir
-
-# use pyfaidx to read in the fasta file to create a dictionary-like object and in the event of a duplicate sequence keey only take the first entry💪💪💪
-seqs1 = pyfaidx.Fasta(fasta1, duplicate_action="first")
-
-# pull original names and sequences into lists
-original_seq_names_list = []
-seqs_list = []
-for i in seqs1.keys():
-    if (arguments.puertorico == "true"):
-        if ("PR-CVL" not in i): # remove any PR-CVL data
-            original_seq_names_list.append(i)
-            seqs_list.append(seqs1[i][:].seq)
-    else:
-        original_seq_names_list.append(i)
-        seqs_list.append(seqs1[i][:].seq)
-
-
-# remove slashes and create new list of names
-no_slashes_seq_names_list = []
-for i in original_seq_names_list:
-    j = i.replace('/','_')
+
+class GisaidRecords:
+    """Compact index of a multifasta. Each record is stored as four offsets into a
+    read-only mmap of the file (name start/end, sequence start/end), so names and
+    sequences are held once, in the page cache. Names are cleaned and sequences
+    unwrapped only when they are read"""
+
+    def __init__(self, fasta1, puertorico="false", helix="false"):
+        self.helix = helix
+        self.offsets = array.array('Q')
+        self.raw = open(fasta1, 'rb')
+        if os.fstat(self.raw.fileno()).st_size == 0:
+            self.mm = b''
+            return
+        self.mm = mmap.mmap(self.raw.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index(puertorico)
+
+    def index(self, puertorico):
+        # one pass over the headers; in the event of a duplicate name only keep the first entry💪💪💪
+        mm = self.mm
+        seen = set()
+        pos = mm.find(b'>')
+        while pos != -1:
+            header_end = mm.find(b'\n', pos)
+            if header_end == -1:
+                header_end = len(mm)
+            next_pos = mm.find(b'\n>', header_end)
+            seq_end = len(mm) if next_pos == -1 else next_pos
+            # the name is the header up to the first whitespace
+            name = mm[pos + 1:header_end].split(None, 1)
+            name = name[0] if name else b''
+            if name not in seen:
+                seen.add(name)
+                if not (puertorico == "true" and b'PR-CVL' in name): # remove any PR-CVL data
+                    self.offsets.extend((pos + 1, pos + 1 + len(name), header_end + 1, seq_end))
+            pos = -1 if next_pos == -1 else next_pos + 1
+
+    def __len__(self):
+        return len(self.offsets) // 4
+
+    def name(self, i):
+        start, end = self.offsets[4 * i], self.offsets[4 * i + 1]
+        return clean_name(self.mm[start:end].decode(), self.helix)
+
+    def sequence(self, i):
+        """The record's sequence as bytes, with line breaks removed"""
+        start, end = self.offsets[4 * i + 2], self.offsets[4 * i + 3]
+        return self.mm[start:end].translate(None, b' \t\r\n')
+
+    def keys(self):
+        """Cleaned names, once each, in file order"""
+        names = set()
+        for i in range(len(self)):
+            name = self.name(i)
+            if name not in names:
+                names.add(name)
+                yield name
+
+    def items(self):
+        """(cleaned name, sequence) pairs. Names that collide after cleaning are all
+        yielded, so the last one written wins as when they were zipped into a dict"""
+        for i in range(len(self)):
+            yield self.name(i), self.sequence(i)
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def clean_name(name, helix="false"):
+    """Remove slashes and pipes from a GISAID name, and the Helix prefix and year"""
+    j = name.replace('/','_')
     j = j.replace('|',"_") # to prevent accidental piping
-    if (arguments.helix == "true"):
+    if (helix == "true"):
         j = j.replace('hCoV-19_USA_CA-','') # remove hCoV-19_USA_C A- from the beginning of the name
         j = j[:-5] # remove _202* from the end of the name
-    no_slashes_seq_names_list.append(j)
+    return j
+
+def parse_multifasta(fasta1, puertorico="false", helix="false"):
+    """Index the multifasta into GisaidRecords, which lists cleaned names with keys()"""
+    return GisaidRecords(fasta1, puertorico, helix)
 
-# zip sequences and new slashless names into dicitonary
-seqs_dict = dict(zip(no_slashes_seq_names_list, seqs_list))
+def write_individual_fastas(seqs_dict, output_dir_loc):
+    """Write each sequence to its own fasta, returning the dated output directory"""
+    # create variable with timestamp
+    timestr = time.strftime("%Y-%m-%d")
 
-# create variable with timestamp
-timestr = time.strftime("%Y-%m-%d")
+    # make the output directory using the directory path input
+    out_dir = '{}/individual_gisaid_assemblies_{}/'.format(output_dir_loc,timestr)
+    os.makedirs(out_dir, exist_ok=True)
 
-# make the output directory using the directory path input
-os.makedirs('{}/individual_gisaid_assemblies_{}/'.format(output_dir_loc,timestr), exist_ok=True)
+    for i, seq in seqs_dict.items():
+        if isinstance(seq, str):
+            seq = seq.encode()
+        with open('{}{}.fasta'.format(out_dir,i), 'wb') as f:
+            f.write(b'>' + i.encode() + b'\n' + seq + b'\n')
+    return out_dir
 
-# redirect the stdout to file, print to file, reset stdout
-for i in seqs_dict:
-    with open('{}/individual_gisaid_assemblies_{}/{}.fasta'.format(output_dir_loc,timestr,i), 'w') as f:
-        original_stdout = sys.stdout
-        sys.stdout = f
-        j = seqs_dict[i]
-        print('>{}\n{}'.format(i,j))
-        sys.stdout = original_stdout
+if __name__ == '__main__':
+    arguments = get_opts()
+    with parse_multifasta(arguments.gisaid_multifasta_file, arguments.puertorico, arguments.helix) as seqs_dict:
+        write_individual_fastas(seqs_dict, arguments.output_dir)
@@ -15,17 +15,7 @@ if [ -z $alt_delimiter ]; then
 	alt_delimiter="_"
 fi
 
-assembly_files=$(gsutil ls ${gcp_uri}/*.fasta | awk -F'/' '{ print $NF }')
-
-# make set table header
-echo -e "membership:${root_entity}_set_id\t${root_entity}" > ${output_dir}/${set_name}.tsv
-
-for assembly in $assembly_files; do
-  # capture samplename from assembly filename
-  samplename=$(echo ${assembly} | awk -F "${alt_delimiter}|.fasta" '{ print $1 }')
-  # write samplename to the set
-  echo -e "${set_name}\t${samplename}" >> ${output_dir}/${set_name}.tsv
-done
-
-# Import Terra table to sepcified terra_workspace
-python3 /scripts/import_large_tsv/import_large_tsv.py --project ${terra_project} --workspace ${terra_workspace} --tsv ${output_dir}/${set_name}.tsv
+# Create the set table from a single listing and import it
+python3 "$(dirname "$0")/terra_table_from_gcp_assemblies.py" -g ${gcp_uri} -r ${root_entity} \
+  -o ${output_dir} -d "${alt_delimiter}" -s ${set_name} \
+  -p ${terra_project} -w ${terra_workspace} --import_tables set
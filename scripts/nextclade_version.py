@@ -1,64 +1,143 @@
 import requests
 import json
 import re
+import os
 import argparse
 import csv
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-def fetch_wdl_from_github():
-    url = "https://raw.githubusercontent.com/theiagen/public_health_bioinformatics/main/workflows/utilities/wf_organism_parameters.wdl"
-    response = requests.get(url)
+WDL_PATH = 'workflows/utilities/wf_organism_parameters.wdl'
+WDL_URL = 'https://raw.githubusercontent.com/theiagen/public_health_bioinformatics/{branch}/' + WDL_PATH
+
+def default_cache_dir():
+    cache_dir = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(cache_dir, 'nextclade_version')
+
+def fetch_wdl_from_github(branch='main', cache_dir=None):
+    """Fetch the WDL for a branch, revalidating a cached copy with its ETag"""
+    url = WDL_URL.format(branch=branch)
+    if not cache_dir:
+        response = requests.get(url)
+        response.raise_for_status()
+        return response.text
+
+    cache_file = os.path.join(cache_dir, branch.replace('/', '_') + '.wdl')
+    etag_file = cache_file + '.etag'
+    headers = {}
+    if os.path.isfile(cache_file) and os.path.isfile(etag_file):
+        with open(etag_file, 'r') as f:
+            headers['If-None-Match'] = f.read().strip()
+    response = requests.get(url, headers=headers)
+    if response.status_code == 304:
+        with open(cache_file, 'r') as f:
+            return f.read()
     response.raise_for_status()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_file + '.tmp', 'w') as f:
+        f.write(response.text)
+    os.replace(cache_file + '.tmp', cache_file)
+    if response.headers.get('ETag'):
+        with open(etag_file, 'w') as f:
+            f.write(response.headers['ETag'])
     return response.text
 
+def read_wdl_from_checkout(phb_dir, branch=None):
+    """Read the WDL from a local PHB checkout, from a branch if specified"""
+    if branch is None:
+        with open(os.path.join(phb_dir, WDL_PATH), 'r') as f:
+            return f.read()
+    return subprocess.run(['git', '-C', phb_dir, 'show', f'{branch}:{WDL_PATH}'],
+                          check=True, capture_output=True, text=True).stdout
+
+def load_datasets(json_file=None):
+    """Load the Nextclade datasets JSON, listing it with nextclade if no file is provided"""
+    if json_file:
+        with open(json_file, 'r') as f:
+            return json.load(f)
+    listing = subprocess.run(['nextclade', 'dataset', 'list', '--json'],
+                             check=True, capture_output=True, text=True).stdout
+    return json.loads(listing)
+
 def parse_wdl_variables(wdl_content):
     ds_name_pattern = r'String\s+(\w+_nextclade_ds_name)\s*=\s*"([^"]+)"'
     ds_tag_pattern = r'String\s+(\w+_nextclade_ds_tag)\s*=\s*"([^"]+)"'
-    
+
     ds_names = dict(re.findall(ds_name_pattern, wdl_content))
     ds_tags = dict(re.findall(ds_tag_pattern, wdl_content))
-    
+
     return ds_names, ds_tags
 
 def get_latest_version(dataset_info):
+    """Latest tag by release date; tags are timestamps, so they are the fallback"""
     if not dataset_info.get('versions'):
         return None
-    return sorted(dataset_info['versions'], key=lambda x: x['tag'], reverse=True)[0]['tag']
+    return max(dataset_info['versions'],
+               key=lambda x: x.get('updatedAt') or x['tag'])['tag']
+
+def check_versions(wdl_content, dataset_lookup):
+    """Compare the WDL dataset tags to the latest tags, returning CSV rows"""
+    ds_names, ds_tags = parse_wdl_variables(wdl_content)
+    rows = []
+    for var_name, ds_name in ds_names.items():
+        if ds_name == "NA":
+            continue
+
+        current_tag = ds_tags.get(var_name.replace('_name', '_tag'))
+        dataset_info = dataset_lookup.get(ds_name)
+
+        if dataset_info:
+            latest_tag = get_latest_version(dataset_info)
+            needs_update = "Yes" if latest_tag != current_tag else "No"
+            rows.append([var_name, ds_name, latest_tag, current_tag, needs_update])
+        else:
+            rows.append([var_name, ds_name, "Not found in JSON", current_tag, "Unknown"])
+    return rows
+
+def check_branch(branch, dataset_lookup, phb_dir=None, cache_dir=None):
+    if phb_dir:
+        wdl_content = read_wdl_from_checkout(phb_dir, branch)
+    else:
+        wdl_content = fetch_wdl_from_github(branch or 'main', cache_dir)
+    return check_versions(wdl_content, dataset_lookup)
 
 def main():
     parser = argparse.ArgumentParser(description='Compare Nextclade dataset versions between JSON and WDL')
-    parser.add_argument('json_file', help='Path to Nextclade datasets JSON file')
+    parser.add_argument('json_file', nargs='?',
+                        help='Path to Nextclade datasets JSON file (DEFAULT: `nextclade dataset list --json`)')
     parser.add_argument('--output', help='Output CSV file', default='nextclade_versions.csv')
+    parser.add_argument('--phb', help='Local PHB checkout to read the WDL from instead of GitHub')
+    parser.add_argument('--branch', nargs='+',
+                        help='Branches to check; a Branch column is added for multiple (DEFAULT: main, or the checked out files with --phb)')
+    parser.add_argument('--cache_dir', default=default_cache_dir(),
+                        help=f'Cache for WDL files fetched from GitHub (DEFAULT: {default_cache_dir()})')
+    parser.add_argument('--no_cache', action='store_true', help='Do not cache WDL files fetched from GitHub')
     args = parser.parse_args()
 
-    with open(args.json_file, 'r') as f:
-        json_data = json.load(f)
+    json_data = load_datasets(args.json_file)
+    dataset_lookup = {dataset['path']: dataset for dataset in json_data}
 
+    branches = args.branch or [None]
+    cache_dir = None if args.no_cache else args.cache_dir
     try:
-        wdl_content = fetch_wdl_from_github()
-    except requests.RequestException as e:
+        with ThreadPoolExecutor(max_workers=len(branches)) as executor:
+            branch_rows = list(executor.map(
+                lambda x: check_branch(x, dataset_lookup, args.phb, cache_dir), branches))
+    except (requests.RequestException, subprocess.CalledProcessError) as e:
         print(f"Error fetching WDL file: {e}")
         return
 
-    dataset_lookup = {dataset['path']: dataset for dataset in json_data}
-    ds_names, ds_tags = parse_wdl_variables(wdl_content)
-
     with open(args.output, 'w', newline='') as csvfile:
         writer = csv.writer(csvfile)
-        writer.writerow(['Variable Name', 'Dataset Name', 'Latest Tag', 'Current Tag', 'Needs Update'])
-
-        for var_name, ds_name in ds_names.items():
-            if ds_name == "NA":
-                continue
-                
-            current_tag = ds_tags.get(var_name.replace('_name', '_tag'))
-            dataset_info = dataset_lookup.get(ds_name)
-            
-            if dataset_info:
-                latest_tag = get_latest_version(dataset_info)
-                needs_update = "Yes" if latest_tag != current_tag else "No"
-                writer.writerow([var_name, ds_name, latest_tag, current_tag, needs_update])
-            else:
-                writer.writerow([var_name, ds_name, "Not found in JSON", current_tag, "Unknown"])
+        header = ['Variable Name', 'Dataset Name', 'Latest Tag', 'Current Tag', 'Needs Update']
+        if len(branches) > 1:
+            writer.writerow(['Branch'] + header)
+            for branch, rows in zip(branches, branch_rows):
+                writer.writerows([branch] + row for row in rows)
+        else:
+            writer.writerow(header)
+            writer.writerows(branch_rows[0])
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
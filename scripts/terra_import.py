@@ -0,0 +1,215 @@
+#! /usr/bin/env python3
+
+"""
+Import TSVs into Terra data tables. Entity TSVs are split into bounded batches
+that are uploaded concurrently over a pooled session, retrying with backoff.
+"""
+
+import os
+import sys
+import logging
+import argparse
+import threading
+import subprocess
+import http.server
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logging.basicConfig(
+    level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+TERRA_API = "https://api.firecloud.org/api"
+
+
+def get_session(workers=4, retries=5, backoff=2):
+    """Pooled session that retries rate limits and server errors with backoff"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=None,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_token():
+    """Terra access token from $TERRA_TOKEN or gcloud"""
+    if os.environ.get("TERRA_TOKEN"):
+        return os.environ["TERRA_TOKEN"]
+    return subprocess.run(
+        ["gcloud", "auth", "print-access-token"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def batch_tsv(tsv, batch_size=500):
+    """Yield the TSV as header + rows text batches. Membership TSVs are not split,
+    so each set is imported whole"""
+    with open(tsv, "r") as raw:
+        header = raw.readline()
+        if header.startswith("membership:"):
+            batch_size = None
+        rows = []
+        for line in raw:
+            if not line.strip():
+                continue
+            rows.append(line if line.endswith("\n") else line + "\n")
+            if batch_size and len(rows) >= batch_size:
+                yield header + "".join(rows)
+                rows = []
+        if rows:
+            yield header + "".join(rows)
+
+
+def upload_batch(session, url, token, batch):
+    """Upload one TSV batch to the flexible entity import endpoint"""
+    response = session.post(
+        url,
+        headers={"Authorization": f"Bearer {token}"},
+        files={"entities": ("entities.tsv", batch, "text/tab-separated-values")},
+    )
+    response.raise_for_status()
+    return batch.count("\n") - 1
+
+
+def import_tsv(
+    tsv,
+    terra_project,
+    terra_workspace,
+    token,
+    session,
+    batch_size=500,
+    workers=4,
+    api_url=TERRA_API,
+):
+    """Upload a TSV's batches concurrently, returning the number of rows imported.
+    At most two batches per worker are held in memory"""
+    url = f"{api_url}/workspaces/{terra_project}/{terra_workspace}/flexibleImportEntities"
+    rows, batches = 0, 0
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in batch_tsv(tsv, batch_size):
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                rows += sum(future.result() for future in done)
+            pending.add(executor.submit(upload_batch, session, url, token, batch))
+            batches += 1
+        rows += sum(future.result() for future in pending)
+    logger.info(f"Imported {rows} rows in {batches} batches from {tsv}")
+    return rows
+
+
+def import_tsvs(
+    tsvs,
+    terra_project,
+    terra_workspace,
+    batch_size=500,
+    workers=4,
+    api_url=TERRA_API,
+    token=None,
+):
+    """Import TSVs in order, e.g. entities before the sets that reference them"""
+    if token is None:
+        token = get_token()
+    session = get_session(workers)
+    return [
+        import_tsv(
+            tsv,
+            terra_project,
+            terra_workspace,
+            token,
+            session,
+            batch_size=batch_size,
+            workers=workers,
+            api_url=api_url,
+        )
+        for tsv in tsvs
+    ]
+
+
+class MockImportHandler(http.server.BaseHTTPRequestHandler):
+    """Accepts entity imports and counts the batches received"""
+
+    protocol_version = "HTTP/1.1"
+    batches = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        MockImportHandler.batches += 1
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_mock_endpoint():
+    """Serve the mock import endpoint on a local port, returning the server"""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), MockImportHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    usage = "Import TSVs into Terra data tables in concurrent batches"
+    parser = argparse.ArgumentParser(description=usage)
+    parser.add_argument("-p", "--project", required=True, help="Terra project")
+    parser.add_argument("-w", "--workspace", required=True, help="Terra workspace")
+    parser.add_argument(
+        "-t",
+        "--tsv",
+        required=True,
+        nargs="+",
+        help="TSVs to import in order, e.g. entities before sets",
+    )
+    parser.add_argument(
+        "-b", "--batch_size", type=int, default=500, help="Rows per batch; DEFAULT: 500"
+    )
+    parser.add_argument(
+        "-c", "--workers", type=int, default=4, help="Concurrent uploads; DEFAULT: 4"
+    )
+    parser.add_argument("--api_url", default=TERRA_API, help=f"DEFAULT: {TERRA_API}")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Upload the batches to a local mock endpoint instead of Terra",
+    )
+    args = parser.parse_args()
+
+    if args.dry_run:
+        server = start_mock_endpoint()
+        api_url = f"http://127.0.0.1:{server.server_port}/api"
+        token = "dry-run"
+    else:
+        api_url, token = args.api_url, None
+
+    import_tsvs(
+        args.tsv,
+        args.project,
+        args.workspace,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        api_url=api_url,
+        token=token,
+    )
+
+    if args.dry_run:
+        logger.info(f"Dry run: mock endpoint received {MockImportHandler.batches} batches")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
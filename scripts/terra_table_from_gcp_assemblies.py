@@ -0,0 +1,165 @@
+#! /usr/bin/env python3
+
+"""
+Create a Terra entity table of sample names and GCP pointers to assemblies, and
+the set membership table of those samples, from one listing of a GCP URI or a
+local manifest. Both tables are written in a single pass over the listing and
+optionally imported into a Terra workspace.
+"""
+
+import os
+import re
+import sys
+import logging
+import argparse
+import subprocess
+from datetime import datetime
+from terra_import import import_tsvs
+
+logging.basicConfig(
+    level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def list_gcp_assemblies(gcp_uri, ext=".fasta"):
+    """Stream the assembly URIs of a gsutil listing, which is paginated remotely"""
+    proc = subprocess.Popen(
+        ["gsutil", "ls", f"{gcp_uri.rstrip('/')}/*{ext}"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    for line in proc.stdout:
+        if line.strip():
+            yield line.strip()
+    if proc.wait():
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+
+def read_manifest(manifest, gcp_uri=None, ext=".fasta"):
+    """Read assembly paths/URIs from a local manifest, one per line.
+    Bare file names are prefixed with the GCP URI"""
+    with open(manifest, "r") as raw:
+        for line in raw:
+            assembly = line.strip()
+            if not assembly or not assembly.endswith(ext):
+                continue
+            if gcp_uri and "/" not in assembly:
+                assembly = f"{gcp_uri.rstrip('/')}/{assembly}"
+            yield assembly
+
+
+def sample_name_comp(delimiter="_", ext=".fasta"):
+    """Compile the sample name pattern once: the file name up to the delimiter or extension"""
+    return re.compile(f"^(.*?)(?:{re.escape(delimiter)}|{re.escape(ext)})")
+
+
+def write_terra_tables(
+    assemblies,
+    root_entity,
+    entity_tsv,
+    set_tsv,
+    set_name,
+    delimiter="_",
+    ext=".fasta",
+    upload_set=None,
+):
+    """Write the entity and set membership tables in one pass, keeping the first
+    assembly of each sample name. Returns the entity rows. The terra_upload_set
+    column is the set name unless specified"""
+    if upload_set is None:
+        upload_set = set_name
+    name_comp = sample_name_comp(delimiter, ext)
+    samples = set()
+    rows = []
+    with open(entity_tsv, "w") as entity_out, open(set_tsv, "w") as set_out:
+        entity_out.write(f"entity:{root_entity}_id\tassembly_fasta\tterra_upload_set\n")
+        set_out.write(f"membership:{root_entity}_set_id\t{root_entity}\n")
+        for assembly in assemblies:
+            name_match = name_comp.search(os.path.basename(assembly))
+            if not name_match:
+                logger.warning(f"Could not parse a sample name from {assembly}")
+                continue
+            samplename = name_match[1]
+            if samplename in samples:
+                logger.debug(f"Skipping duplicate sample {samplename}: {assembly}")
+                continue
+            samples.add(samplename)
+            rows.append([samplename, assembly, upload_set])
+            entity_out.write(f"{samplename}\t{assembly}\t{upload_set}\n")
+            set_out.write(f"{set_name}\t{samplename}\n")
+    logger.info(f"Wrote {len(samples)} samples to {entity_tsv} and {set_tsv}")
+    return rows
+
+
+def main():
+    usage = "Create Terra entity and set tables of assemblies in a GCP URI or manifest"
+    parser = argparse.ArgumentParser(description=usage)
+    parser.add_argument(
+        "-g", "--gcp_uri", help="GCP URI containing <samplename>[<delimiter>...].fasta"
+    )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        help="Local manifest of assembly paths/URIs instead of listing -g; "
+        + "bare file names are prefixed with -g",
+    )
+    parser.add_argument(
+        "-r",
+        "--root_entity",
+        required=True,
+        help='Terra table root entity, without "entity:" or "_id"',
+    )
+    parser.add_argument("-o", "--output_dir", default="./", help="Output directory")
+    parser.add_argument(
+        "-d", "--delimiter", default="_", help='Sample name delimiter; DEFAULT: "_"'
+    )
+    parser.add_argument(
+        "-s",
+        "--set_name",
+        default=f"{datetime.now().date().isoformat()}-set",
+        help="Set name applied to all samples; DEFAULT: <YYYY-MM-DD>-set",
+    )
+    parser.add_argument("-e", "--ext", default=".fasta", help="Assembly extension")
+    parser.add_argument("-p", "--terra_project", help="Terra project to import into")
+    parser.add_argument("-w", "--terra_workspace", help="Terra workspace to import into")
+    parser.add_argument(
+        "--import_tables",
+        default="both",
+        choices=["both", "entity", "set"],
+        help="Tables to import with -p/-w; DEFAULT: both",
+    )
+    args = parser.parse_args()
+
+    if not args.gcp_uri and not args.manifest:
+        raise AttributeError("ERROR: -g or -m required")
+    if bool(args.terra_project) != bool(args.terra_workspace):
+        raise AttributeError("ERROR: -p and -w are required together")
+
+    if args.manifest:
+        assemblies = read_manifest(args.manifest, args.gcp_uri, args.ext)
+    else:
+        assemblies = list_gcp_assemblies(args.gcp_uri, args.ext)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    date_tag = datetime.now().strftime("%Y-%m-%d-%Hh-%Mm-%Ss")
+    entity_tsv = os.path.join(args.output_dir, f"assembly_terra_table_{date_tag}.tsv")
+    set_tsv = os.path.join(args.output_dir, f"{args.set_name}.tsv")
+    write_terra_tables(
+        assemblies,
+        args.root_entity,
+        entity_tsv,
+        set_tsv,
+        args.set_name,
+        delimiter=args.delimiter,
+        ext=args.ext,
+    )
+
+    # The set references the entities, so they are imported first
+    if args.terra_project:
+        tsvs = {"both": [entity_tsv, set_tsv], "entity": [entity_tsv], "set": [set_tsv]}
+        import_tsvs(tsvs[args.import_tables], args.terra_project, args.terra_workspace)
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
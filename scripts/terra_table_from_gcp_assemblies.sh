@@ -43,25 +43,7 @@ if [ -z $terra_upload_set ]; then
 	terra_upload_set="$(date -I)-set"
 fi
 
-# Capture date to tag output file
-date_tag=$(date +"%Y-%m-%d-%Hh-%Mm-%Ss")
-
-# Capture samplenames from existing assembleis in given gcp_uri
-assembly_files=$(gsutil ls ${gcp_uri}/*.fasta | awk -F'/' '{ print $NF }')
-
-# Create Terra table with gcp pointers
-echo -e "entity:${root_entity}_id\tassembly_fasta\tterra_upload_set" > ${output_dir}/assembly_terra_table_${date_tag}.tsv
-
-for assembly in $assembly_files; do
-  # capture samplename from assembly filename
-  samplename=$(echo ${assembly} | awk -F"${alt_delimiter}|.fasta" '{ print $1 }')
-  # write samplename, gcp pointer, and terra_upload_set to terra data table
-  echo -e "${samplename}\t${gcp_uri}/${assembly}\t${terra_upload_set}" >> ${output_dir}/assembly_terra_table_${date_tag}.tsv
-done
-
-# remove duplicates from tsv if samplename not unique
-awk '!a[$1]++' ${output_dir}/assembly_terra_table_${date_tag}.tsv > temp.tsv && mv temp.tsv ${output_dir}/assembly_terra_table_${date_tag}.tsv
-
-# Import Terra table to sepcified terra_workspace
-python3 /scripts/import_large_tsv/import_large_tsv.py --project ${terra_project} --workspace ${terra_workspace} --tsv ${output_dir}/assembly_terra_table_${date_tag}.tsv
-
+# Create the Terra table with gcp pointers from a single listing and import it
+python3 "$(dirname "$0")/terra_table_from_gcp_assemblies.py" -g ${gcp_uri} -r ${root_entity} \
+  -o ${output_dir} -d "${alt_delimiter}" -s ${terra_upload_set} \
+  -p ${terra_project} -w ${terra_workspace} --import_tables entity
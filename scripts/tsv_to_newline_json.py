@@ -16,39 +16,44 @@ def get_opts():
 				help='Output file name required, must be a string.')
 	args = p.parse_args()
 	return args
-arguments = get_opts()
+# Writing the newline json file from a header and rows of values
+def write_newline_json(headers_array, rows, out_fname):
+  headers_array = list(headers_array)
+  headers_array[0] = "specimen_id"
+  with open(out_fname+'.json', 'w') as outfile:
+    for line_array in rows:
+      outfile.write('{')
+      for x,y in zip(headers_array, line_array):
+        if x == "nextclade_aa_dels" or x == "nextclade_aa_subs":
+          y = y.replace("|", ",")
+        if y == "NA":
+          y = ""
+        if y == "N/A":
+          y = ""
+        if y == "Unknown":
+          y = ""
+        if y == "unknown":
+          y = ""
+        if y == "UNKNOWN":
+          y = ""
+        if y == "required_for_submission":
+          y = ""
+        if "Uneven pairs:" in y:
+          y = ""
+        if x == "County":
+          pass
+        else:
+          outfile.write('"'+x+'"'+':'+'"'+y+'"'+',')
+      outfile.write('"notes":""}'+'\n')
 
-# Set output file name
-out_fname = arguments.output_name
+if __name__ == '__main__':
+  arguments = get_opts()
 
-# Writing the newline json file from tsv output above
-with open(arguments.tsv_file, 'r') as infile:
+  # Set output file name
+  out_fname = arguments.output_name
+
+  # Writing the newline json file from tsv output above
+  with open(arguments.tsv_file, 'r') as infile:
     headers = infile.readline()
     headers_array = headers.strip().split('\t')
-    headers_array[0] = "specimen_id"
-    with open(out_fname+'.json', 'w') as outfile:
-      for line in infile:
-        outfile.write('{')
-        line_array=line.strip().split('\t')
-        for x,y in zip(headers_array, line_array):
-          if x == "nextclade_aa_dels" or x == "nextclade_aa_subs":
-            y = y.replace("|", ",")
-          if y == "NA":
-            y = ""
-          if y == "N/A":
-            y = ""
-          if y == "Unknown":
-            y = ""
-          if y == "unknown":
-            y = ""
-          if y == "UNKNOWN":
-            y = ""
-          if y == "required_for_submission":
-            y = ""
-          if "Uneven pairs:" in y:
-            y = ""
-          if x == "County":
-            pass
-          else:
-            outfile.write('"'+x+'"'+':'+'"'+y+'"'+',')
-        outfile.write('"notes":""}'+'\n')
+    write_newline_json(headers_array, (line.strip().split('\t') for line in infile), out_fname)
@@ -6,7 +6,7 @@ discrepant with downstream workflows. Propose updates to the task I/O and docume
 
 - Currently writes recommended changes, but staged for automated updating in place
 - Does not account for variables that have the same name, but different type declarations
-- Does not accomodate multiple calls to task in same workflow
+- Multiple calls to a task in the same workflow are merged into one set of inputs
 - Staged for remote runs, but loading remote WDL files with WDL is currently non-functional,
     - Remove required from -i and -r, uncomment other arguments to initialize remote function
 """
@@ -15,6 +15,8 @@ import os
 import re
 import sys
 import glob
+import json
+import hashlib
 import logging
 try:
     import WDL 
@@ -23,12 +25,30 @@ except ImportError:
 import requests
 import argparse
 from io import StringIO
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 logging.basicConfig(level = logging.DEBUG,
                     format = '%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# WDL import statements: import "<uri>" [as <namespace>]
+import_comp = re.compile(r'^\s*import\s+"([^"]+)"(?:\s+as\s+(\w+))?', re.MULTILINE)
+
+# WDL tokens; strings and command blocks are delimited separately
+wdl_token_comp = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>\#[^\n]*)
+  | (?P<heredoc><<<.*?>>>)
+  | (?P<string>["'])
+  | (?P<name>[A-Za-z_][\w.]*)
+  | (?P<punct>[{}()\[\],:=])
+  | (?P<other>.)
+''', re.VERBOSE | re.DOTALL)
+
+# String representation of a WDL declaration that can be cached as JSON
+WDLDecl = namedtuple('WDLDecl', ['name', 'type', 'expr'])
+
 def set_wdl_paths():
     """Set dependency paths relative to remote repo"""
     source = 'tasks/utilities/data_export/task_export_taxon_table.wdl'
@@ -111,27 +131,139 @@ def check_repo_head(repo_dir):
     else:
         return False
 
-def get_io(wdl_file, local = False):
+def file_hash(file_path):
+    """SHA-256 of a file's contents"""
+    with open(file_path, 'rb') as raw:
+        return hashlib.sha256(raw.read()).hexdigest()
+
+def decls2lists(decls):
+    """Convert WDL declarations to JSON serializable [name, type, expr] lists"""
+    return [[decl.name, str(decl.type), 
+             str(decl.expr) if decl.expr is not None else None]
+            for decl in decls or []]
+
+def summarize_wdl(wdl):
+    """Extract the imports, task I/O, and workflow I/O of a loaded WDL document"""
+    summary = {'imports': [], 'tasks': {}, 'workflow': None}
+    for wdl_import in wdl.imports:
+        summary['imports'].append({'uri': wdl_import.uri,
+                                   'namespace': wdl_import.namespace})
+    for task in wdl.tasks:
+        summary['tasks'][task.name] = {'inputs': decls2lists(task.inputs),
+                                       'outputs': decls2lists(task.outputs)}
+    if wdl.workflow:
+        summary['workflow'] = {'name': wdl.workflow.name,
+                               'inputs': decls2lists(wdl.workflow.inputs),
+                               'outputs': decls2lists(wdl.workflow.outputs)}
+    return summary
+
+def wdl_dependencies(wdl, deps = None):
+    """Collect the local paths of all documents a WDL document transitively imports"""
+    if deps is None:
+        deps = set()
+    for wdl_import in wdl.imports:
+        dep_path = wdl_import.doc.pos.abspath
+        if dep_path not in deps and os.path.isfile(dep_path):
+            deps.add(dep_path)
+            wdl_dependencies(wdl_import.doc, deps)
+    return deps
+
+class WDLCache:
+    """Persistent on-disk cache of WDL summaries keyed by file path and content
+    hash. Entries are invalidated when the file or any file it imports changes"""
+
+    def __init__(self, cache_path = None):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.hashes = {}
+        self.modified = False
+        if cache_path and os.path.isfile(cache_path):
+            try:
+                with open(cache_path, 'r') as raw:
+                    self.entries = json.load(raw)
+            except ValueError:
+                logger.warning(f'Ignoring unreadable WDL cache {cache_path}')
+
+    def hash(self, wdl_file):
+        """Hash a file once per run"""
+        if wdl_file not in self.hashes:
+            self.hashes[wdl_file] = file_hash(wdl_file) \
+                if os.path.isfile(wdl_file) else None
+        return self.hashes[wdl_file]
+
+    def is_valid(self, wdl_file):
+        """Check if a WDL file's entry matches its and its imports' contents"""
+        entry = self.entries.get(wdl_file)
+        return bool(entry) and 'calls' in entry and entry['sha256'] == self.hash(wdl_file) \
+            and all(self.hash(dep) == dep_hash 
+                    for dep, dep_hash in entry['dependencies'].items())
+
+    def update(self, wdl_file, entry):
+        """Store an entry computed elsewhere, e.g. in a worker process"""
+        self.entries[wdl_file] = entry
+        self.modified = True
+
+    def entry(self, wdl_file):
+        """Return the valid cache entry for a WDL file, reparsing it if stale"""
+        if self.is_valid(wdl_file):
+            return self.entries[wdl_file]
+        logger.debug(f'Parsing {wdl_file}')
+        wdl = WDL.load(wdl_file)
+        with open(wdl_file, 'r') as raw:
+            calls = extract_calls(raw.read())
+        entry = {'sha256': self.hash(wdl_file),
+                 'dependencies': {dep: self.hash(dep) 
+                                  for dep in sorted(wdl_dependencies(wdl))},
+                 'summary': summarize_wdl(wdl),
+                 'calls': calls}
+        self.entries[wdl_file] = entry
+        self.modified = True
+        return entry
+
+    def summary(self, wdl_file):
+        """Return the import and I/O summary of a WDL file"""
+        return self.entry(wdl_file)['summary']
+
+    def namespace_inputs(self, wdl_file, namespace, task):
+        """Return the cached inputs of a namespace.task call in a WDL file"""
+        calls = self.entry(wdl_file)['calls']
+        return merge_call_inputs(calls.get(f'{namespace}.{task}', []))
+
+    def save(self):
+        """Write the cache to disk if it changed"""
+        if not self.cache_path or not self.modified:
+            return
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok = True)
+        with open(self.cache_path + '.tmp', 'w') as out:
+            json.dump(self.entries, out)
+        os.replace(self.cache_path + '.tmp', self.cache_path)
+        self.modified = False
+
+def get_io(wdl_file, local = False, cache = None):
     """Get inputs and outputs of a WDL file.
     Currently only suitable for WDL files with either tasks or workflows"""
-    if local:
-        wf = WDL.load(wdl_file)
+    if local and cache is not None:
+        summary = cache.summary(wdl_file)
+    elif local:
+        summary = summarize_wdl(WDL.load(wdl_file))
     else:
         wf_tmp = remote_load(wdl_file)
-        wf = WDL.load(wf_tmp)
+        summary = summarize_wdl(WDL.load(wf_tmp))
     task2inputs = {}
     task2outputs = {}
     wf2inputs = {}
     wf2outputs = {}
     # Populate task inputs
-    if wf.tasks:
-        for task in wf.tasks:
-            task2inputs[task.name] = task.inputs
-            task2outputs[task.name] = task.outputs
+    for task_name, task_io in summary['tasks'].items():
+        task2inputs[task_name] = [WDLDecl(*x) for x in task_io['inputs']]
+        task2outputs[task_name] = [WDLDecl(*x) for x in task_io['outputs']]
     # Populate workflow inputs
-    if wf.workflow:
-        wf2inputs[wf.workflow.name] = wf.workflow.inputs
-        wf2outputs[wf.workflow.name] = wf.workflow.outputs
+    if summary['workflow']:
+        wf_name = summary['workflow']['name']
+        wf2inputs[wf_name] = [WDLDecl(*x) for x in summary['workflow']['inputs']]
+        wf2outputs[wf_name] = [WDLDecl(*x) for x in summary['workflow']['outputs']]
 
     #x_info = {'inputs': {'<task/wf_name>': [<input1>, <input2>, ...], ...},
     task_info, wf_info = {}, {}
@@ -142,77 +274,153 @@ def get_io(wdl_file, local = False):
 
     return task_info, wf_info
 
+def string_end(wdl_data, i):
+    """Index after the string starting at i, including ~{} placeholders"""
+    quote = wdl_data[i]
+    i += 1
+    while i < len(wdl_data):
+        char = wdl_data[i]
+        if char == '\\':
+            i += 2
+            continue
+        elif char == quote:
+            return i + 1
+        elif char in '~$' and wdl_data[i + 1:i + 2] == '{':
+            i = brace_end(wdl_data, i + 2, strings = True)
+            continue
+        i += 1
+    raise ValueError('ERROR: unterminated WDL string')
+
+def brace_end(wdl_data, i, strings = False):
+    """Index after the brace closing the block opened just before i"""
+    depth = 1
+    while i < len(wdl_data):
+        char = wdl_data[i]
+        if strings and char in '"\'':
+            i = string_end(wdl_data, i)
+            continue
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if not depth:
+                return i + 1
+        i += 1
+    raise ValueError('ERROR: unterminated WDL block')
+
+def tokenize_wdl(wdl_data):
+    """Tokenize WDL into (kind, text, start, end) tuples without whitespace and
+    comments. Strings and command blocks are single tokens"""
+    tokens = []
+    i = 0
+    while i < len(wdl_data):
+        token = wdl_token_comp.match(wdl_data, i)
+        kind, end = token.lastgroup, token.end()
+        if kind == 'string':
+            end = string_end(wdl_data, i)
+        # old-style command blocks are shell, so only their braces are tracked
+        elif kind == 'name' and token.group() == 'command':
+            block = re.compile(r'\s*\{').match(wdl_data, end)
+            if block:
+                kind, end = 'command', brace_end(wdl_data, block.end())
+        if kind not in {'space', 'comment'}:
+            tokens.append((kind, wdl_data[i:end], i, end))
+        i = end
+    return tokens
+
+def expr_end(tokens, i, stops = {','}):
+    """Index of the token ending an expression: a stop or unmatched closing bracket"""
+    depth = 0
+    while True:
+        text = tokens[i][1]
+        if text in {'(', '[', '{'}:
+            depth += 1
+        elif text in {')', ']', '}'}:
+            if not depth:
+                return i
+            depth -= 1
+        elif not depth and text in stops:
+            return i
+        i += 1
+
+def parse_map_literal(tokens, wdl_data):
+    """Parse the tokens of a {key: expr, ...} literal into {key: expr}"""
+    entries = {}
+    i = 1
+    while tokens[i][1] != '}':
+        key_end = expr_end(tokens, i, stops = {':'})
+        val_end = expr_end(tokens, key_end + 1)
+        key = wdl_data[tokens[i][2]:tokens[key_end - 1][3]].strip('"\'')
+        entries[key] = wdl_data[tokens[key_end + 1][2]:tokens[val_end - 1][3]]
+        i = val_end + 1 if tokens[val_end][1] == ',' else val_end
+    return entries
+
+def parse_call_body(tokens, i, wdl_data):
+    """Parse a call body's [input:] name = expr, ... from token i, returning the
+    {input: expr} and the index after the closing brace. Map literal entries 
+    are also included as inputs"""
+    inputs = {}
+    if tokens[i][1] == 'input' and tokens[i + 1][1] == ':':
+        i += 2
+    while tokens[i][1] != '}':
+        name = tokens[i][1]
+        # WDL 1.1 allows bare inputs that are bound to the same name
+        if tokens[i + 1][1] != '=':
+            inputs[name] = name
+            end = i + 1
+        else:
+            end = expr_end(tokens, i + 2)
+            expr = tokens[i + 2:end]
+            inputs[name] = wdl_data[expr[0][2]:expr[-1][3]]
+            if expr[0][1] == '{':
+                inputs.update(parse_map_literal(expr, wdl_data))
+        i = end + 1 if tokens[end][1] == ',' else end
+    return inputs, i + 1
+
+def extract_calls(wdl_data):
+    """Extract the inputs of every call in one pass over a WDL file's tokens,
+    {'namespace.task': [{input: expr}, ...]} in call order"""
+    tokens = tokenize_wdl(wdl_data)
+    calls = defaultdict(list)
+    i = 0
+    try:
+        while i < len(tokens) - 1:
+            kind, text = tokens[i][:2]
+            if kind != 'name' or text != 'call' or tokens[i + 1][0] != 'name':
+                i += 1
+                continue
+            call_name = tokens[i + 1][1]
+            i += 2
+            # skip the alias and after clauses
+            while i < len(tokens) - 1 and tokens[i][1] in {'as', 'after'}:
+                i += 2
+            if i < len(tokens) and tokens[i][1] == '{':
+                inputs, i = parse_call_body(tokens, i + 1, wdl_data)
+            else:
+                inputs = {}
+            calls[call_name].append(inputs)
+    except IndexError:
+        raise ValueError('ERROR: unterminated WDL call block')
+    return dict(calls)
+
+def merge_call_inputs(call_inputs):
+    """Merge the inputs of each call to a task, keeping the first expression"""
+    namespace_inputs = {}
+    for inputs in call_inputs:
+        for inp_name, inp_expr in inputs.items():
+            namespace_inputs.setdefault(inp_name, inp_expr)
+    return namespace_inputs
+
 def obtain_namespace_inputs(wdl_file, namespace, task, local = False):
-    """Obtain the inputs of a task in a WDL file w/o WDL library.
-    WDL must abide by Theiagen PHB code contribution guidelines"""
+    """Obtain the inputs of a task in a WDL file w/o WDL library"""
     # Read the WDL file
     if local:
         with open(wdl_file, 'r') as raw:
             wdl_data = raw.read()
     else:
         wdl_data = remote_load(wdl_file)
-
-    # prepare a compiled regex to find the task and its inputs,
-    call_comp = re.compile(r'call\W+' + f'{namespace}\.{task}')
-    # prepare parsing variables
-    parse_block = False
-    parse_input = False
-    nested_brackets = 0
-    closed_brackets = 0
-    matches = []
-    # parse the WDL file line by line to identify the task call and its inputs
-    for line in wdl_data.split('\n'):
-        if not parse_block:
-            if call_comp.search(line) is not None:
-                parse_block = True
-                nested_brackets += 1
-        if parse_block:
-            # capture the data for the task call
-            # identify when input parsing begins
-            if not parse_input:
-                # DOES NOT account for any inputs within the first input line
-                if 'input:' in line:
-                    parse_input = True
-                    matches.append([])
-            else:
-                # Capture the input data
-                matches[-1].append(line)
-                # Account for nestedness, DOES NOT exclude brackets in strings
-                if '{' in line:
-                    nested_brackets += 1
-                if '}' in line:
-                    closed_brackets += 1
-        # identify when a call is complete while accounting for nestedness
-        if nested_brackets == closed_brackets and parse_input:
-            # Reset parsing variables
-            parse_block = False
-            parse_input = False
-            nested_brackets = 0
-            closed_brackets = 0
-                
-    # Only one instance of the task should be found
-    if len(matches) > 1:
-        raise AttributeError(f'ERROR: Multiple instances of {namespace}.{task} found in {wdl_file}' \
-                + ' - this script is not equipped to handle this')
-
-    # Parse the input variables and expressions
-    namespace_inputs = {}
-    for input_ in matches[0]:
-        inp_data = input_.strip().split('=')
-        # obtain the nonmapped inputs
-        if len(inp_data) == 2:
-            inp_name = inp_data[0].strip()
-            inp_expr = inp_data[1].strip().replace(',', '')
-            namespace_inputs[inp_name] = inp_expr
-        # obtain the mapped inputs
-        else:
-            map_data = input_.strip().split(':')
-            if len(map_data) == 2:
-                map_name = map_data[0].strip().replace('"', '').replace("'", '')
-                map_expr = map_data[1].strip().replace(',', '')
-                namespace_inputs[map_name] = map_expr
-
-    return namespace_inputs
+    calls = extract_calls(wdl_data)
+    return merge_call_inputs(calls.get(f'{namespace}.{task}', []))
 
 def get_downstream_remote(dependencies, task = 'export_taxon_table'):
     """Parse downstream dependencies of a WDL file remotely.
@@ -234,31 +442,66 @@ def get_downstream_remote(dependencies, task = 'export_taxon_table'):
 
     return downstream, preexisting
 
+def index_imports(wdl_files):
+    """Build a reverse import map, {imported_path: {importer_path: namespace}},
+    by scanning import statements without loading the WDL files"""
+    imported2importers = defaultdict(dict)
+    for wdl_file in wdl_files:
+        with open(wdl_file, 'r') as raw:
+            wdl_data = raw.read()
+        wdl_dir = os.path.dirname(wdl_file)
+        for uri, namespace in import_comp.findall(wdl_data):
+            # remote imports cannot be the local focal file
+            if '://' in uri:
+                continue
+            # WDL defaults the namespace to the imported file's basename
+            if not namespace:
+                namespace = os.path.basename(uri).replace('.wdl', '')
+            uri_path = format_path(os.path.join(wdl_dir, uri))
+            imported2importers[uri_path][wdl_file] = namespace
+    return imported2importers
+
+def analyze_wdl(wdl_file):
+    """Parse a WDL file and its call inputs into a cache entry. Runs in a worker
+    process, so it returns the entry instead of storing it"""
+    return WDLCache().entry(wdl_file)
+
+def prefetch_downstream(wdl_files, cache, threads = 1):
+    """Analyze uncached downstream files in one process pool,
+    then merge the entries into the cache in order"""
+    stale = sorted(x for x in set(wdl_files) if not cache.is_valid(x))
+    if threads > 1 and len(stale) > 1:
+        with ProcessPoolExecutor(max_workers = min(threads, len(stale))) as executor:
+            entries = executor.map(analyze_wdl, stale)
+            for wdl_file, entry in zip(stale, entries):
+                cache.update(wdl_file, entry)
+
 def get_downstream_local(foc_file, downstream_wdls, 
-                         task = 'export_taxon_table'):
-    """Get and parse downstream dependencies of a WDL file"""
+                         task = 'export_taxon_table', cache = None,
+                         threads = 1, index = None):
+    """Get and parse downstream dependencies of a WDL file.
+    A prebuilt import index can be supplied to reuse across focal tasks"""
+    if cache is None:
+        cache = WDLCache()
+    if index is None:
+        index = index_imports(downstream_wdls)
     preexisting = {}
     downstream = {}
 
+    # Only the files that import the focal file are fully loaded
+    importers = index.get(foc_file, {})
+    prefetch_downstream(importers, cache, threads = threads)
+
     # extract the IO of downstream WDL files
-    for wdl_file in downstream_wdls:
-        wdl = WDL.load(wdl_file)
-        wdl_dir = os.path.dirname(wdl_file)
-        for wdl_import in wdl.imports:
-            uri = wdl_import.uri
-            uri_path = format_path(os.path.join(wdl_dir, uri))
-            # Check if the focal file is imported by the downstream file
-            if uri_path == foc_file:
-                logger.info(f'\t{wdl_file}')
-                task_io, wf_io = get_io(wdl_file, local = True)
-                namespace = wdl_import.namespace
-                # Get I/O from the downstream file
-                downstream[wdl_file] = {'namespace': namespace,
-                                        'outputs': wf_io['outputs'],
-                                        'inputs': wf_io['inputs']}
-                # Get the inputs to the task call in the downstream file
-                preexisting[wdl_file] = obtain_namespace_inputs(wdl_file, namespace, 
-                                                                task, local = True)
+    for wdl_file, namespace in sorted(importers.items()):
+        logger.info(f'\t{wdl_file}')
+        task_io, wf_io = get_io(wdl_file, local = True, cache = cache)
+        # Get I/O from the downstream file
+        downstream[wdl_file] = {'namespace': namespace,
+                                'outputs': wf_io['outputs'],
+                                'inputs': wf_io['inputs']}
+        # Get the inputs to the task call in the downstream file
+        preexisting[wdl_file] = cache.namespace_inputs(wdl_file, namespace, task)
 
     return downstream, preexisting
 
@@ -368,6 +611,36 @@ def output_changes(wdl2out_hash,
             logger.error(f'{failed_var} {task_in2type_set[failed_var]}')
         raise ValueError
             
+def get_focal_io(input_file, local = True, cache = None):
+    """Get the I/O of a focal WDL file, which must be either tasks or a workflow"""
+    task_io, wf_io = get_io(input_file, local = local, cache = cache)
+    if task_io and wf_io:
+        raise AttributeError("ERROR: this script does not support WDL files with both tasks and workflows")
+    elif task_io:
+        return task_io
+    else:
+        return wf_io
+
+def report_changes(downstream_io, preexisting_inputs, out_file, task_name,
+                   ignored_inputs, ignored_outputs, nonmapped_inputs, mapping_name):
+    """Compile the downstream I/O and write the focal task's proposed changes"""
+    if not downstream_io:
+        raise FileNotFoundError(f"No downstream dependencies found for {task_name}")
+    # the focal task's own mapping input is never a removable call input
+    nonmapped_inputs = set(nonmapped_inputs).union({mapping_name})
+
+    # Compile the downstream I/O for easier parsing
+    wdl2out_hash, wdl2namespace, wdl2in_hash, wdl2in2type, wdl2out2type \
+        = compile_downstream_io(downstream_io)
+
+    # Write the new inputs for the focal WDL file
+    with open(out_file, 'w') as out_obj:
+        output_changes(wdl2out_hash, 
+                      wdl2namespace, task_name, preexisting_inputs,
+                      nonmapped_inputs, ignored_inputs, ignored_outputs, 
+                      wdl2in_hash, wdl2in2type, wdl2out2type,
+                      mapping_name, file_obj = out_obj)
+
 def main(input_file, downstream_wdls, repo_dir, out_file, 
          task_name = 'export_taxon_table',
          ignored_inputs = {'cpu', 'memory', 'disk_size', 'docker'},
@@ -376,7 +649,7 @@ def main(input_file, downstream_wdls, repo_dir, out_file,
                              'gambit_predicted_taxon', 'columns_to_export',
                              'taxon_table', 'samplename'},
          mapping_name = 'columns_to_export',
-         remote = False):
+         remote = False, cache_path = None, threads = 1):
     """Main function:
     Compile inputs from input_file
     ID downstream dependencies
@@ -387,14 +660,9 @@ def main(input_file, downstream_wdls, repo_dir, out_file,
     Report documentation changes for input_file inputs
     """
 
+    cache = WDLCache(cache_path)
     # Get inputs and outputs of focal WDL file
-    task_io, wf_io = get_io(input_file, local = bool(repo_dir))
-    if task_io and wf_io:
-        raise AttributeError("ERROR: this script does not support WDL files with both tasks and workflows")
-    elif task_io:
-        wdl_info = task_io
-    else:
-        wdl_info = wf_io
+    wdl_info = get_focal_io(input_file, local = bool(repo_dir), cache = cache)
 
     logger.info('Identifying downstream dependencies:')
     if not remote:
@@ -402,27 +670,76 @@ def main(input_file, downstream_wdls, repo_dir, out_file,
         wdls_prep = set(collect_files(repo_dir, 'wdl', recursive = True))
         wdl_files = sorted(wdls_prep.difference({input_file}))
         downstream_io, preexisting_inputs = get_downstream_local(input_file, 
-                                                                 wdl_files)
+                                                                 wdl_files,
+                                                                 cache = cache,
+                                                                 threads = threads)
+        cache.save()
         downstream_wdls = sorted(downstream_io.keys())
     else:
         # Remotely collect downstream dependencies
         downstream_io, preexisting_inputs = get_downstream_remote(downstream_wdls)
         
-    if not downstream_io:
-        raise FileNotFoundError("No downstream dependencies found")
-
-    # Compile the downstream I/O for easier parsing
-    wdl2out_hash, wdl2namespace, wdl2in_hash, wdl2in2type, wdl2out2type \
-        = compile_downstream_io(downstream_io)
+    report_changes(downstream_io, preexisting_inputs, out_file, task_name,
+                   ignored_inputs, ignored_outputs, nonmapped_inputs, mapping_name)
+
+def batch_main(specs, repo_dir, out_dir, cache_path = None, threads = 1,
+               ignored_inputs = {'cpu', 'memory', 'disk_size', 'docker'},
+               ignored_outputs = {'taxon_table_status'}, 
+               nonmapped_inputs = {'terra_project', 'terra_workspace', 
+                                   'gambit_predicted_taxon', 'columns_to_export',
+                                   'taxon_table', 'samplename'}):
+    """Batch function:
+    Collect and index the repo's WDL files once
+    Parse the downstream dependencies of every focal task in one pass
+    Report task call changes for each (input_file, task_name, mapping_name) spec
+    """
+    cache = WDLCache(cache_path)
+    wdl_files = sorted(set(collect_files(repo_dir, 'wdl', recursive = True)))
+    index = index_imports(wdl_files)
+
+    importers = set()
+    for input_file, task_name, mapping_name in specs:
+        get_focal_io(input_file, local = True, cache = cache)
+        importers.update(index.get(input_file, {}))
+    prefetch_downstream(importers, cache, threads = threads)
+
+    for input_file, task_name, mapping_name in specs:
+        logger.info(f'Identifying downstream dependencies of {task_name}:')
+        downstream_io, preexisting_inputs = get_downstream_local(input_file,
+                                                                 wdl_files,
+                                                                 task = task_name,
+                                                                 cache = cache,
+                                                                 index = index)
+        out_file = os.path.join(out_dir, f'update_taxon_tables_io_{task_name}.txt')
+        report_changes(downstream_io, preexisting_inputs, out_file, task_name,
+                       ignored_inputs, ignored_outputs, nonmapped_inputs, 
+                       mapping_name)
+    cache.save()
+
+def read_batch_specs(spec_file, repo_dir):
+    """Read a tab-delimited <task WDL>\t<task name>[\t<mapping name>] spec file;
+    relative WDL paths are relative to the repo"""
+    specs = []
+    with open(spec_file, 'r') as raw:
+        for line in raw:
+            if not line.strip() or line.startswith('#'):
+                continue
+            data = line.rstrip('\n').split('\t')
+            if len(data) < 2:
+                raise ValueError(f'ERROR: batch spec line requires a WDL and task: {line}')
+            wdl_file = data[0].strip()
+            if not os.path.isabs(wdl_file):
+                wdl_file = os.path.join(repo_dir, wdl_file)
+            mapping_name = data[2].strip() if len(data) > 2 and data[2].strip() \
+                           else 'columns_to_export'
+            specs.append((format_path(wdl_file), data[1].strip(), mapping_name))
+    return specs
+
+def default_cache_path():
+    """Default parsed WDL cache location under the user cache directory"""
+    cache_dir = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(cache_dir, 'update_taxon_tables_io', 'wdl_cache.json')
 
-    # Write the new inputs for the focal WDL file
-    with open(out_file, 'w') as out_obj:
-        output_changes(wdl2out_hash, 
-                      wdl2namespace, task_name, preexisting_inputs,
-                      nonmapped_inputs, ignored_inputs, ignored_outputs, 
-                      wdl2in_hash, wdl2in2type, wdl2out2type,
-                      mapping_name, file_obj = out_obj)
-    
 def cli():
   #  base_repo_url = f'https://raw.githubusercontent.com/theiagen/public_health_bioinformatics/'
     parser = argparse.ArgumentParser(description = "Sync task_export_taxon_table.wdl inputs/outputs " \
@@ -431,11 +748,32 @@ def cli():
  #                       help = 'Remote git branch for remote runs; DEFAULT: "main"')
   #  parser.add_argument("-u", "--url", help = f'Remote git URL; DEFAULT: {base_repo_url}',
    #                     default = base_repo_url)
-    parser.add_argument("-i", "--input", required = True,
+    parser.add_argument("-i", "--input",
                         help = '[-r] Local task_export_taxon_table.wdl; Requires -r')
+    parser.add_argument("-b", "--batch",
+                        help = '[-r] Tab-delimited focal task specs for a single pass: ' \
+                             + '<task WDL>\t<task name>[\t<mapping name>]; Requires -r')
     parser.add_argument("-r", "--repo", required = True,
                         help = "[-i] Local git repo dir for local runs; Requires -i")
+    parser.add_argument("-c", "--cache", default = default_cache_path(),
+                        help = f'Parsed WDL cache file; DEFAULT: {default_cache_path()}')
+    parser.add_argument("--no_cache", action = 'store_true',
+                        help = 'Do not read or write the parsed WDL cache')
+    parser.add_argument("-t", "--threads", type = int, default = os.cpu_count(),
+                        help = 'Processes for analyzing downstream WDL files; DEFAULT: CPU count')
     args = parser.parse_args()
+    cache_path = None if args.no_cache else format_path(args.cache)
+
+    if args.batch:
+        if not args.repo:
+            raise AttributeError('ERROR: -b requires -r')
+        repo_uri = format_path(args.repo)
+        if not check_repo_head(repo_uri):
+            raise FileNotFoundError("ERROR: Repo directory is not a git repository")
+        specs = read_batch_specs(format_path(args.batch), repo_uri)
+        batch_main(specs, repo_uri, format_path('./'), cache_path = cache_path,
+                   threads = args.threads)
+        return
 
     if not args.input and not args.repo:
         raise AttributeError('ERROR: remote run is not implemented, use -i and -r for local')
@@ -456,7 +794,8 @@ def cli():
         dependencies = []
 
     out_file = format_path('./update_taxon_tables_io.txt')
-    main(source_task, dependencies, repo_uri, out_file, remote = remote)
+    main(source_task, dependencies, repo_uri, out_file, remote = remote,
+         cache_path = cache_path, threads = args.threads)
 
 if __name__ == '__main__':
     cli()
@@ -1,25 +1,56 @@
 #! /usr/bin/env python3
 
+import io
 import os
 import re
 import csv
 import sys
+import stat
 import gzip
 import json
+import time
+import codecs
+import fcntl
+import inspect
+import resource
+import zlib
+import hashlib
 import shutil
 import logging
 import tarfile
+import threading
 import zipfile
 import argparse
 import requests
 import subprocess
 from datetime import datetime
+from contextlib import contextmanager
+from functools import partial, wraps
+from collections import defaultdict
+from accession2taxon import build_acc2taxon_db
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 
 logging.basicConfig(
-    level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
+    level=logging.DEBUG,
+    format="%(asctime)s - %(threadName)s - %(levelname)s - %(message)s",
 )
 logger = logging.getLogger(__name__)
 
+# shared HTTP session, see get_session()
+_SESSION = None
+# performance records for the JSON report, see perf_record()
+PERF_RECORDS = []
+_PERF_LOCK = threading.Lock()
+_PERF_LOCAL = threading.local()
+# boto config overrides passed to every gsutil call, e.g. for a local emulator
+GSUTIL_OPTIONS = []
+# Linux ioctl request to clone a file's extents (reflink)
+FICLONE = 0x40049409
+# accession prefixes preferred as representatives of duplicate genomes
+REFSEQ_PREFIXES = ("NC_", "AC_", "NZ_", "GCF_")
+# rough peak memory (GB) of each database build, used to schedule stages
+STAGE_MEMORY_GB = {"skani": 16, "checkv": 2, "kraken2": 64}
+
 
 def expand_env_var(path):
     """Expands environment variables by regex substitution"""
@@ -73,23 +104,296 @@ def mk_output_dir(
     return out_dir + "/"
 
 
-def download_file(url, out_path, max_attempts=3, force=False):
-    """Download a file from a URL"""
+def path_size(path):
+    """Return the size in bytes of a file or everything under a directory"""
+    if not path or not os.path.exists(path):
+        return 0
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file_ in files:
+            try:
+                total += os.lstat(os.path.join(root, file_)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def count_downloaded(n_bytes):
+    """Add downloaded bytes to the performance records open in this thread"""
+    for record in getattr(_PERF_LOCAL, "records", []):
+        record["bytes_downloaded"] += n_bytes
+
+
+@contextmanager
+def perf_record(name, output=None):
+    """Record wall time, CPU time, peak RSS, bytes downloaded and bytes
+    written to output (file or directory) for the performance report.
+    Child process counters are process-wide, so they overlap between
+    concurrent stages"""
+    # per-thread CPU time where the platform supports it
+    rusage_self = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+    record = {
+        "name": name,
+        "thread": threading.current_thread().name,
+        "bytes_downloaded": 0,
+        "bytes_written": 0,
+    }
+    if not hasattr(_PERF_LOCAL, "records"):
+        _PERF_LOCAL.records = []
+    _PERF_LOCAL.records.append(record)
+    size_start = path_size(output)
+    self_start = resource.getrusage(rusage_self)
+    child_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+    try:
+        yield record
+    finally:
+        self_end = resource.getrusage(rusage_self)
+        child_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+        record["wall_s"] = round(time.time() - start, 3)
+        record["cpu_s"] = round(
+            max(
+                0.0,
+                self_end.ru_utime + self_end.ru_stime
+                - self_start.ru_utime - self_start.ru_stime,
+            ),
+            3,
+        )
+        record["children_cpu_s"] = round(
+            max(
+                0.0,
+                child_end.ru_utime + child_end.ru_stime
+                - child_start.ru_utime - child_start.ru_stime,
+            ),
+            3,
+        )
+        # ru_maxrss is a high-water mark in KB on Linux
+        record["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        record["children_peak_rss_kb"] = child_end.ru_maxrss
+        if output:
+            record["bytes_written"] = max(0, path_size(output) - size_start)
+        _PERF_LOCAL.records.remove(record)
+        with _PERF_LOCK:
+            PERF_RECORDS.append(record)
+
+
+def instrument(output=None):
+    """Decorate a function to add a performance record per call. output
+    maps the bound arguments to the path whose growth counts as written"""
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            out_path = None
+            if output:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                out_path = output(bound.arguments)
+            with perf_record(func.__name__, out_path):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def write_perf_report(report_path, start, threads):
+    """Write the performance records as a JSON report"""
+    with _PERF_LOCK:
+        records = list(PERF_RECORDS)
+    report = {
+        "start": datetime.fromtimestamp(start).isoformat(),
+        "wall_s": round(time.time() - start, 3),
+        "threads": threads,
+        "records": records,
+    }
+    with open(report_path, "w") as out:
+        json.dump(report, out, indent=2)
+    logger.info(f"Performance report written to {report_path}")
+    return report_path
+
+
+def get_session(pool_size=8, max_retries=3):
+    """Return a connection-pooled requests session, shared across downloads"""
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries
+        )
+        _SESSION.mount("http://", adapter)
+        _SESSION.mount("https://", adapter)
+    return _SESSION
+
+
+def file_checksum(file_path, algorithm="md5", chunk_size=1024 * 1024):
+    """Compute the hex digest of a file"""
+    hasher = hashlib.new(algorithm)
+    with open(file_path, "rb") as raw:
+        for chunk in iter(lambda: raw.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def download_range(url, tmp_path, start, end, chunk_size=1024 * 1024):
+    """Download a byte range of a URL into its offset of a preallocated file"""
+    headers = {"Range": f"bytes={start}-{end}"}
+    n_bytes = 0
+    with get_session().get(url, headers=headers, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise requests.exceptions.RequestException(
+                f"Server ignored range request for {url}"
+            )
+        with open(tmp_path, "r+b") as out:
+            out.seek(start)
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                out.write(chunk)
+                n_bytes += len(chunk)
+    return n_bytes
+
+
+def download_segments(url, tmp_path, size, segments, chunk_size=1024 * 1024):
+    """Download a file as parallel ranged segments.
+    The preallocated file has holes until every segment completes, so it is
+    only moved to tmp_path once complete and is removed if a segment fails"""
+    seg_path = tmp_path + ".seg"
+    with open(seg_path, "wb") as out:
+        out.truncate(size)
+    try:
+        fetch_segments(url, seg_path, size, segments, chunk_size)
+    except BaseException:
+        os.remove(seg_path)
+        raise
+    os.rename(seg_path, tmp_path)
+
+
+def fetch_segments(url, tmp_path, size, segments, chunk_size=1024 * 1024):
+    """Download the ranged segments of a file into a preallocated file"""
+    seg_size = -(-size // segments)
+    ranges = [
+        (start, min(start + seg_size, size) - 1) for start in range(0, size, seg_size)
+    ]
+    with ThreadPoolExecutor(
+        max_workers=segments, thread_name_prefix=threading.current_thread().name
+    ) as executor:
+        futures = [
+            executor.submit(download_range, url, tmp_path, start, end, chunk_size)
+            for start, end in ranges
+        ]
+        # workers have no performance records, so count in this thread
+        for future in futures:
+            count_downloaded(future.result())
+
+
+def remote_size(url, response=None):
+    """Size of a remote file, from a 416 response's Content-Range or a HEAD request"""
+    if response is not None:
+        content_range = response.headers.get("Content-Range", "")
+        if content_range.startswith("bytes */"):
+            return int(content_range.split("/")[-1])
+    head = get_session().head(url, allow_redirects=True, timeout=60)
+    head.raise_for_status()
+    size = head.headers.get("Content-Length")
+    return int(size) if size else None
+
+
+def ncbi_md5(url):
+    """MD5 of a file from the md5checksums.txt in its NCBI FTP directory, if listed"""
+    md5_url = url.rsplit("/", 1)[0] + "/md5checksums.txt"
+    file_name = os.path.basename(url)
+    try:
+        response = get_session().get(md5_url, timeout=60)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Could not retrieve {md5_url}, skipping checksum")
+        logger.warning(e)
+        return None
+    for line in response.text.splitlines():
+        fields = line.split()
+        if len(fields) == 2 and os.path.basename(fields[1]) == file_name:
+            return fields[0]
+    logger.warning(f"{file_name} is not listed in {md5_url}, skipping checksum")
+    return None
+
+
+def download_stream(url, tmp_path, chunk_size=1024 * 1024):
+    """Stream a URL to disk in chunks, resuming a partial download via Range"""
+    offset = os.path.getsize(tmp_path) if os.path.isfile(tmp_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with get_session().get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 416:
+            # the partial file is only complete if it is the full size
+            if remote_size(url, response) == offset:
+                return
+            os.remove(tmp_path)
+            raise requests.exceptions.RequestException(
+                f"Partial download of {url} does not match the remote size, restarting"
+            )
+        response.raise_for_status()
+        # servers that ignore the range request restart from byte zero
+        if offset and response.status_code != 206:
+            logger.warning(f"Server does not support resuming {url}, restarting")
+            offset = 0
+        elif offset:
+            logger.info(f"Resuming {url} from byte {offset}")
+        with open(tmp_path, "ab" if offset else "wb") as out:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                out.write(chunk)
+                count_downloaded(len(chunk))
+                yield chunk
+
+
+@instrument(output=lambda x: x["out_path"])
+def download_file(
+    url,
+    out_path,
+    max_attempts=3,
+    force=False,
+    segments=1,
+    checksum=None,
+    checksum_algorithm="md5",
+    chunk_size=1024 * 1024,
+):
+    """Download a file from a URL.
+    Streams to a ".tmp" file that is resumed on retry, optionally downloads
+    parallel ranged segments, and verifies the checksum if one is provided"""
     # skip if the file exists
     if os.path.isfile(out_path) and not force:
         logger.info(f"{out_path} already exists")
         return
+    tmp_path = out_path + ".tmp"
+    if force and os.path.isfile(tmp_path):
+        os.remove(tmp_path)
     # attempt to download the file
     for attempt in range(max_attempts):
         try:
-            # download the file
-            response = requests.get(url)
-            response.raise_for_status()
-            with open(out_path + ".tmp", "wb") as out:
-                out.write(response.content)
-            os.rename(out_path + ".tmp", out_path)
+            size = None
+            if segments > 1 and not os.path.isfile(tmp_path):
+                head = get_session().head(url, allow_redirects=True, timeout=60)
+                head.raise_for_status()
+                if head.headers.get("Accept-Ranges") == "bytes":
+                    size = int(head.headers.get("Content-Length", 0)) or None
+            if size:
+                download_segments(url, tmp_path, size, segments, chunk_size)
+            else:
+                for _ in download_stream(url, tmp_path, chunk_size):
+                    pass
+            if checksum:
+                digest = file_checksum(tmp_path, checksum_algorithm)
+                if digest != checksum.lower():
+                    # a corrupt partial file cannot be resumed
+                    os.remove(tmp_path)
+                    raise ValueError(
+                        f"{checksum_algorithm} mismatch for {url}: {digest} != {checksum}"
+                    )
+            os.rename(tmp_path, out_path)
             break
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             logger.error(f"Failed to download {url} on attempt {attempt + 1}")
             logger.error(e)
     else:
@@ -102,15 +406,94 @@ def decompress_tarchive(tar_path, out_dir):
     return format_path(tar_path.replace(".tar.gz", ""))
 
 
-def compress_tarchive(base_path, compression="tar", ext=".tar"):
-    """Compress a directory into a tar archive"""
+def compression_cmd(ext, threads=1):
+    """Return a multi-threaded compressor command for an archive extension"""
     if ext == ".tar.gz":
-        file_open = "w:gz"
-    elif ext == ".tar":
-        file_open = "w"
-    with tarfile.open(base_path + ext, file_open) as tar:
-        tar.add(base_path, arcname=os.path.basename(base_path))
-    return base_path + ext
+        pigz = shutil.which("pigz")
+        if pigz:
+            return [pigz, "-c", "-p", str(threads)]
+    elif ext == ".tar.zst":
+        zstd = shutil.which("zstd")
+        if zstd:
+            return [zstd, "-c", "-q", f"-T{threads}"]
+    return None
+
+
+def stream_tarchive(base_path, tar_path, comp_cmd=None, upload_uri=None):
+    """Pipe tar through an external compressor into a file, optionally
+    streaming the same bytes to Google Storage; returns the MD5 digest"""
+    tar_cmd = [
+        "tar",
+        "-cf",
+        "-",
+        "-C",
+        os.path.dirname(os.path.abspath(base_path)),
+        os.path.basename(base_path),
+    ]
+    procs = [subprocess.Popen(tar_cmd, stdout=subprocess.PIPE)]
+    if comp_cmd:
+        procs.append(
+            subprocess.Popen(comp_cmd, stdin=procs[0].stdout, stdout=subprocess.PIPE)
+        )
+        # allow tar to receive SIGPIPE if the compressor exits
+        procs[0].stdout.close()
+    gs_proc = None
+    if upload_uri:
+        gs_proc = subprocess.Popen(
+            gsutil_cmd(["cp", "-", upload_uri]), stdin=subprocess.PIPE
+        )
+    hasher = hashlib.md5()
+    archive_stream = procs[-1].stdout
+    with open(tar_path, "wb") as out:
+        for chunk in iter(lambda: archive_stream.read(1024 * 1024), b""):
+            hasher.update(chunk)
+            out.write(chunk)
+            if gs_proc:
+                gs_proc.stdin.write(chunk)
+    archive_stream.close()
+    exits = [proc.wait() for proc in procs]
+    if gs_proc:
+        gs_proc.stdin.close()
+        exits.append(gs_proc.wait())
+    if any(exits):
+        raise subprocess.CalledProcessError(
+            max(exits), " | ".join(" ".join(proc.args) for proc in procs)
+        )
+    return hasher.hexdigest()
+
+
+@instrument(output=lambda x: x["base_path"].rstrip("/") + x["ext"])
+def compress_tarchive(
+    base_path, compression="tar", ext=".tar", threads=1, upload_uri=None
+):
+    """Compress a directory into a tar archive and write an MD5 manifest.
+    Uses tar with pigz (.tar.gz) or zstd (.tar.zst) when available, otherwise
+    falls back to single-threaded tarfile. If upload_uri is provided, the
+    archive is uploaded to Google Storage, streaming when possible"""
+    base_path = base_path.rstrip("/")
+    tar_path = base_path + ext
+    comp_cmd = compression_cmd(ext, threads)
+    if comp_cmd or (ext == ".tar" and shutil.which("tar")):
+        digest = stream_tarchive(base_path, tar_path, comp_cmd, upload_uri)
+    else:
+        if ext == ".tar.gz":
+            file_open = "w:gz"
+        elif ext == ".tar":
+            file_open = "w"
+        else:
+            raise ValueError(f"No compressor available for {ext}")
+        with tarfile.open(tar_path, file_open) as tar:
+            tar.add(base_path, arcname=os.path.basename(base_path))
+        digest = file_checksum(tar_path, "md5")
+        if upload_uri and push_to_gs_bucket(upload_uri, tar_path):
+            raise subprocess.CalledProcessError(1, f"gsutil cp {tar_path} {upload_uri}")
+
+    manifest_path = tar_path + ".md5"
+    with open(manifest_path, "w") as out:
+        out.write(f"{digest}  {os.path.basename(tar_path)}\n")
+    if upload_uri and push_to_gs_bucket(upload_uri + ".md5", manifest_path):
+        logger.error(f"Failed to push {manifest_path} to Google Storage")
+    return tar_path
 
 
 def upload_mngr(path2upload, upload_path, gs_bucket, upload=False):
@@ -120,20 +503,58 @@ def upload_mngr(path2upload, upload_path, gs_bucket, upload=False):
             f"{gs_bucket}{upload_path}", path2upload
         )
         if gs_exit:
-            logger.error("Failed to push Kraken2 database to Google Storage")
+            logger.error(f"Failed to push {path2upload} to Google Storage")
             logger.error(
                 f"Push manually via: `gsutil -m cp -r {path2upload} {gs_bucket}{upload_path}`"
             )
-            raise Exception("Failed to push Kraken2 database to Google Storage")
+            raise Exception(f"Failed to push {path2upload} to Google Storage")
     else:
-        logger.info(f"Upload Kraken2 DB to Google Storage with: `gsutil -m cp -r {path2upload} {gs_bucket}{upload_path}`")
+        logger.info(f"Upload {path2upload} to Google Storage with: `gsutil -m cp -r {path2upload} {gs_bucket}{upload_path}`")
+
+
+class UploadQueue:
+    """Upload artifacts to a GS bucket in the background as they are queued,
+    so uploads overlap with the builds that remain"""
+
+    def __init__(self, gs_bucket, upload=False, workers=4):
+        self.gs_bucket = gs_bucket
+        self.upload = upload
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="upload"
+        )
+        self.futures = []
+
+    def submit(self, path2upload, upload_path):
+        """Queue an artifact for upload, along with its MD5 manifest if it has one"""
+        uploads = [(path2upload, upload_path)]
+        if os.path.isfile(path2upload + ".md5"):
+            uploads.append((path2upload + ".md5", upload_path + ".md5"))
+        for path_, upload_path_ in uploads:
+            logger.info(f"Queueing {path_} for upload")
+            future = self.executor.submit(
+                upload_mngr, path_, upload_path_, self.gs_bucket, upload=self.upload
+            )
+            self.futures.append((path_, future))
+
+    def wait(self):
+        """Block until all queued uploads finish and raise if any failed"""
+        failed = []
+        for path2upload, future in self.futures:
+            try:
+                future.result()
+            except Exception:
+                failed.append(path2upload)
+        self.executor.shutdown()
+        if failed:
+            raise Exception(f"Failed to push to Google Storage: {', '.join(failed)}")
 
 
 def download_viral_genomes(viral_accs_path, out_dir):
     """Calls NCBI datasets to download viral genomes"""
-    precd_dir = os.getcwd()
-    os.chdir(out_dir)
-    if not os.path.isfile("ncbi_dataset.zip") and not os.path.isdir("ncbi_dataset"):
+    # run datasets in out_dir without changing the cwd of concurrent stages
+    if not os.path.isfile(out_dir + "ncbi_dataset.zip") and not os.path.isdir(
+        out_dir + "ncbi_dataset"
+    ):
         datasets_exit = 1
         attempts = 0
         while datasets_exit and attempts < 3:
@@ -148,7 +569,7 @@ def download_viral_genomes(viral_accs_path, out_dir):
                 "--inputfile",
                 viral_accs_path,
             ]
-            datasets_exit = subprocess.call(datasets_cmd)
+            datasets_exit = subprocess.call(datasets_cmd, cwd=out_dir)
         if attempts == 3 and datasets_exit != 0:
             logger.error(
                 "Failed to download genomes from NCBI datasets after 3 attempts"
@@ -156,15 +577,15 @@ def download_viral_genomes(viral_accs_path, out_dir):
             raise Exception("Failed to download genomes from NCBI datasets")
     else:
         logger.info("NCBI datasets already downloaded")
-    os.chdir(precd_dir)
     return out_dir + "ncbi_dataset.zip"
 
 
 def download_genomes(accs_path, out_dir):
     """Calls NCBI datasets to download genomes"""
-    precd_dir = os.getcwd()
-    os.chdir(out_dir)
-    if not os.path.isfile("ncbi_dataset.zip") and not os.path.isdir("ncbi_dataset"):
+    # run datasets in out_dir without changing the cwd of concurrent stages
+    if not os.path.isfile(out_dir + "ncbi_dataset.zip") and not os.path.isdir(
+        out_dir + "ncbi_dataset"
+    ):
         datasets_exit = 1
         attempts = 0
         while datasets_exit and attempts < 3:
@@ -179,7 +600,7 @@ def download_genomes(accs_path, out_dir):
                 "--inputfile",
                 accs_path,
             ]
-            datasets_exit = subprocess.call(datasets_cmd)
+            datasets_exit = subprocess.call(datasets_cmd, cwd=out_dir)
         if attempts == 3:
             logger.error(
                 "Failed to download genomes from NCBI datasets after 3 attempts"
@@ -187,20 +608,45 @@ def download_genomes(accs_path, out_dir):
             raise Exception("Failed to download genomes from NCBI datasets")
     else:
         logger.info("NCBI datasets already downloaded")
-    os.chdir(precd_dir)
     return out_dir + "ncbi_dataset.zip"
 
 
-def pull_datasets_genomes(out_dir, fa_dir):
-    """Moves genomes in independent directoiries to a fasta directory"""
+def stage_file(src, dst):
+    """Stage a file by hard link, then reflink, falling back to a copy when
+    the source and destination are on different filesystems"""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        with open(src, "rb") as src_in, open(dst, "wb") as dst_out:
+            fcntl.ioctl(dst_out.fileno(), FICLONE, src_in.fileno())
+        return
+    except OSError:
+        pass
+    shutil.copyfile(src, dst)
+
+
+def pull_datasets_genomes(out_dir, fa_dir, workers=8):
+    """Stages genomes in independent directories into a fasta directory"""
     prefix_dir = f"{out_dir}/ncbi_dataset/data/"
-    acc_dirs = [
-        prefix_dir + x for x in os.listdir(prefix_dir) if os.path.isdir(prefix_dir + x)
-    ]
-    for acc_dir in acc_dirs:
-        acc = os.path.basename(acc_dir)
-        acc_fa = prefix_dir + acc + "/" + os.listdir(acc_dir)[0]
-        shutil.copy(acc_fa, f"{fa_dir}{acc}.fna")
+    src2dst = {}
+    with os.scandir(prefix_dir) as acc_entries:
+        for acc_entry in acc_entries:
+            if not acc_entry.is_dir():
+                continue
+            with os.scandir(acc_entry.path) as fa_entries:
+                acc_fas = sorted(x.path for x in fa_entries if x.is_file())
+            if acc_fas:
+                src2dst[acc_fas[0]] = f"{fa_dir}{acc_entry.name}.fna"
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix=threading.current_thread().name
+    ) as executor:
+        for _ in executor.map(stage_file, src2dst.keys(), src2dst.values()):
+            pass
 
     acc2taxon = {}
     data_json_path = f"{out_dir}/ncbi_dataset/data/assembly_data_report.jsonl"
@@ -225,6 +671,7 @@ def unzip_datasets(out_dir, datasets_zip, rm=True, virus=True):
         return f"{out_dir}ncbi_dataset/data/", f"{out_dir}ncbi_dataset/data/assembly_data_report.jsonl"
 
 
+@instrument(output=lambda x: x["out_dir"] + "full_genome.fna")
 def chunk_datasets(accs_path, out_dir, chunk_size=250000):
     """Chunk the datasets file into smaller files"""
     with open(accs_path, "r") as infile:
@@ -301,6 +748,7 @@ def output_fa(fa_dict, out_dir, seq_name, description=False):
             )
 
 
+@instrument(output=lambda x: x["out_dir"])
 def multifas2fas(fa_path, out_dir):
     """Convert a FASTA string to a dictionary"""
     fa_dict = {"sequence": "", "description": ""}
@@ -327,8 +775,83 @@ def multifas2fas(fa_path, out_dir):
     return fa_dict
 
 
-def parse_viral_metadata(viral_metadata_path, out_dir):
-    """Parse the viral metadata and extract the complete accessions"""
+# AllNuclMetadata.csv columns used to filter accessions, resolved by header name
+VIRAL_METADATA_COLUMNS = {
+    "accession": "accession",
+    "species": "species",
+    "family": "family",
+    "sequence_type": "sequence_type",
+    "completeness": "nuc_completeness",
+    "segment": "segment",
+}
+
+
+@contextmanager
+def gunzip_stream(gz_path):
+    """Open a gzipped file as text, decompressing with pigz when available"""
+    pigz = shutil.which("pigz")
+    if not pigz:
+        with gzip.open(gz_path, "rt", newline="") as text_in:
+            yield text_in
+        return
+    # pigz decompresses in a separate process, so parsing overlaps inflation
+    proc = subprocess.Popen([pigz, "-dc", gz_path], stdout=subprocess.PIPE)
+    try:
+        yield io.TextIOWrapper(proc.stdout, encoding="utf-8", newline="")
+    finally:
+        proc.stdout.close()
+        pigz_exit = proc.wait()
+    if pigz_exit:
+        raise subprocess.CalledProcessError(pigz_exit, [pigz, "-dc", gz_path])
+
+
+def gunzip_chunks(chunks):
+    """Incrementally decompress an iterable of gzipped bytes into text lines"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # multibyte characters may be split across chunks
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    remainder = ""
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        # handle concatenated gzip members
+        while decompressor.unused_data:
+            unused = decompressor.unused_data
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data += decompressor.decompress(unused)
+        if not data:
+            continue
+        lines = (remainder + decoder.decode(data)).split("\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    remainder += decoder.decode(decompressor.flush(), final=True)
+    if remainder:
+        yield remainder
+
+
+def stream_download(url, out_path, chunk_size=1024 * 1024):
+    """Download a file while yielding its raw bytes as they are written"""
+    tmp_path = out_path + ".tmp"
+    # a partial download cannot be parsed from the middle, so start over
+    if os.path.isfile(tmp_path):
+        os.remove(tmp_path)
+    yield from download_stream(url, tmp_path, chunk_size)
+    os.rename(tmp_path, out_path)
+
+
+def resolve_metadata_columns(header, columns=VIRAL_METADATA_COLUMNS):
+    """Map column keys to indices of a metadata header by column name"""
+    name2index = {
+        name.strip().lstrip("#").lower(): i for i, name in enumerate(header)
+    }
+    missing = [col for col in columns.values() if col not in name2index]
+    if missing:
+        raise KeyError(f"Viral metadata missing columns: {', '.join(missing)}")
+    return {key: name2index[col] for key, col in columns.items()}
+
+
+def filter_viral_metadata(rows, out):
+    """Write complete non-SARS-CoV-2 accessions and return segmented accessions"""
     coronavirus_names = {
         "severe acute respiratory syndrome-related coronavirus",
         "betacoronavirus pandemicum",
@@ -339,30 +862,73 @@ def parse_viral_metadata(viral_metadata_path, out_dir):
         "arenaviridae",
         "phenuiviridae",
     }
-    viral_accs_path = f"{out_dir}viral_accessions.txt"
+    reader = csv.reader(rows)
+    cols = resolve_metadata_columns(next(reader))
+    acc_i, species_i, family_i = cols["accession"], cols["species"], cols["family"]
+    type_i, complete_i, segment_i = (
+        cols["sequence_type"],
+        cols["completeness"],
+        cols["segment"],
+    )
+    # species and family are low cardinality, so lowercase each value once
+    species2sars, family2segmented = {}, {}
     count = 0
     segmented_accs = []
+    for row in reader:
+        if row[complete_i] != "complete":
+            continue
+        species = row[species_i]
+        if species not in species2sars:
+            species2sars[species] = species.lower() in coronavirus_names
+        # skip SARS-CoV-2 in one db
+        if species2sars[species]:
+            continue
+        family = row[family_i]
+        if family not in family2segmented:
+            family2segmented[family] = family.lower() in segmented_families
+        # we don't want redundancy and refseq segment reporting may be false
+        # we get segmented viruses from refseq later
+        if family2segmented[family]:
+            segmented_accs.append(row[acc_i])
+        elif row[type_i].lower() != "refseq":
+            # forego segments because they cannot be reliably linked
+            if not row[segment_i]:
+                count += 1
+                out.write(row[acc_i] + "\n")
+            else:
+                segmented_accs.append(row[acc_i])
+        elif row[segment_i]:
+            segmented_accs.append(row[acc_i])
+
+    return count, segmented_accs
+
+
+@instrument(output=lambda x: x["viral_metadata_path"])
+def parse_viral_metadata(viral_metadata_path, out_dir, viral_metadata_url=None):
+    """Parse the viral metadata and extract the complete accessions.
+    If a URL is provided and the metadata is absent, parse while downloading.
+    If the stream fails, the download is resumed with retries and then parsed"""
+    viral_accs_path = f"{out_dir}viral_accessions.txt"
     with open(viral_accs_path, "w") as out:
-        with gzip.open(viral_metadata_path, "rt") as raw:
-            reader = csv.reader(raw)
-            next(reader)
-            for row in reader:
-                # skip SARS-CoV-2 in one db
-                if row[6].lower() not in coronavirus_names:
-                    if row[12] == "complete":
-                        # we don't want redundancy and refseq segment reporting may be false
-                        # we get segmented viruses from refseq later
-                        if row[8].lower() in segmented_families:
-                            segmented_accs.append(row[0])
-                        elif row[11].lower() != "refseq":
-                            # forego segments because they cannot be reliably linked
-                            if not row[14]:
-                                count += 1
-                                out.write(row[0] + "\n")
-                            else:
-                                segmented_accs.append(row[0])
-                        elif row[14]:
-                            segmented_accs.append(row[0])
+        streamed = False
+        if viral_metadata_url and not os.path.isfile(viral_metadata_path):
+            try:
+                chunks = stream_download(viral_metadata_url, viral_metadata_path)
+                count, segmented_accs = filter_viral_metadata(
+                    gunzip_chunks(chunks), out
+                )
+                streamed = True
+            except requests.exceptions.RequestException as e:
+                logger.warning(
+                    f"Streaming {viral_metadata_url} failed, downloading before parsing"
+                )
+                logger.warning(e)
+                out.seek(0)
+                out.truncate()
+                download_file(viral_metadata_url, viral_metadata_path)
+        if not streamed:
+            with gunzip_stream(viral_metadata_path) as raw:
+                count, segmented_accs = filter_viral_metadata(raw, out)
 
     logger.info(f"Found {count} compatible non-SARS-CoV-2 viral accessions")
 
@@ -413,6 +979,112 @@ def lineage2accs(lineages, out_dir, accessions=1):
     return accs_path
 
 
+def hit2accession(hit):
+    """Return the unversioned nucleotide accession a gene report hit annotates"""
+    for region in hit.get("genomic_regions", []):
+        acc = region.get("gene_range", {}).get("accession_version")
+        if acc:
+            return acc.split(".")[0]
+    return None
+
+
+def gene_summary_batch(batch_accs, batch_path, max_attempts=3):
+    """Map a batch of accessions to assembly accessions via a datasets gene
+    summary, parsing the JSON lines as they stream from stdout"""
+    with open(batch_path, "w") as out:
+        out.write("\n".join(batch_accs) + "\n")
+    datasets_cmd = [
+        "datasets",
+        "summary",
+        "gene",
+        "accession",
+        "--as-json-lines",
+        "--report",
+        "gene",
+        "--inputfile",
+        batch_path,
+    ]
+    for attempt in range(max_attempts):
+        acc2assemblies = defaultdict(set)
+        datasets_proc = subprocess.Popen(
+            datasets_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        for line in datasets_proc.stdout:
+            if not line.strip():
+                continue
+            hit = json.loads(line)
+            if "annotations" in hit:
+                if "assembly_accession" in hit["annotations"][0]:
+                    acc2assemblies[hit2accession(hit)].add(
+                        hit["annotations"][0]["assembly_accession"]
+                    )
+        datasets_proc.stdout.close()
+        if not datasets_proc.wait():
+            return acc2assemblies
+        logger.warning(f"datasets gene summary failed for {batch_path} on attempt {attempt + 1}")
+    raise Exception(f"datasets gene summary failed for {batch_path}")
+
+
+def segments2assemblies(segmented_accs, seg_dir, batch_size=1000, workers=4):
+    """Map segmented accessions to assembly accessions in concurrent batches.
+    Results are cached per accession, so reruns only query what is missing"""
+    cache_path = f"{seg_dir}gene_summary_cache.tsv"
+    cached_accs, assemblies = set(), set()
+    if os.path.isfile(cache_path):
+        with open(cache_path, "r") as cache_in:
+            for line in cache_in:
+                acc, assembly = line.rstrip("\n").split("\t")
+                cached_accs.add(acc)
+                if assembly:
+                    assemblies.add(assembly)
+    query_accs = [x for x in segmented_accs if x.split(".")[0] not in cached_accs]
+    batches = [
+        query_accs[i : i + batch_size] for i in range(0, len(query_accs), batch_size)
+    ]
+    logger.info(
+        f"Querying {len(query_accs)} segmented accessions in {len(batches)} batches, "
+        + f"{len(segmented_accs) - len(query_accs)} cached"
+    )
+
+    failed = 0
+    with open(cache_path, "a") as cache_out:
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix=threading.current_thread().name
+        ) as executor:
+            future2batch = {
+                executor.submit(
+                    gene_summary_batch, batch, f"{seg_dir}segmented_batch{i + 1}.txt"
+                ): batch
+                for i, batch in enumerate(batches)
+            }
+            for i, future in enumerate(as_completed(future2batch)):
+                batch = future2batch[future]
+                try:
+                    acc2assemblies = future.result()
+                except Exception as e:
+                    logger.error(e)
+                    failed += 1
+                    continue
+                for acc_assemblies in acc2assemblies.values():
+                    assemblies.update(acc_assemblies)
+                # cache every queried accession, including those without hits
+                for acc in batch:
+                    acc = acc.split(".")[0]
+                    for assembly in acc2assemblies.pop(acc, {""}):
+                        cache_out.write(f"{acc}\t{assembly}\n")
+                # hits that could not be attributed to a queried accession
+                for acc_assemblies in acc2assemblies.values():
+                    for assembly in acc_assemblies:
+                        cache_out.write(f"\t{assembly}\n")
+                cache_out.flush()
+                logger.info(f"Completed gene summary batch {i + 1}/{len(batches)}")
+    if failed:
+        logger.error(
+            f"{failed} gene summary batches failed, rerun to retry uncached accessions"
+        )
+    return assemblies
+
+
 def compile_complete_segments(segmented_accs, fa_dir, out_dir):
     """Identify complete segment accessions"""
     if not os.path.isdir(f"{out_dir}segmented/"):
@@ -423,25 +1095,7 @@ def compile_complete_segments(segmented_accs, fa_dir, out_dir):
     with open(segmented_accs_path, "w") as out:
         out.write("\n".join(segmented_accs) + "\n")
     if not os.path.isdir(f"{out_dir}segmented/ncbi_dataset/"):
-        datasets_cmd = [
-            "datasets",
-            "summary",
-            "gene",
-            "accession",
-            "--as-json-lines",
-            "--report",
-            "gene",
-            "--inputfile",
-            segmented_accs_path,
-        ]
-        datasets_exit = subprocess.run(datasets_cmd, stdout=subprocess.PIPE)
-        datasets_raw = datasets_exit.stdout.decode("utf-8")
-        datasets_json = [json.loads(line) for line in datasets_raw.split("\n") if line]
-        gcfs = []
-        for hit in datasets_json:
-            if "annotations" in hit:
-                if "assembly_accession" in hit["annotations"][0]:
-                    gcfs.append(hit["annotations"][0]["assembly_accession"])
+        gcfs = segments2assemblies(segmented_accs, seg_dir)
         full_gcfs = sorted(set(x for x in gcfs if x.startswith(("GCF_", "GCA_"))))
         complete_segments_path = f"{out_dir}segmented/complete_segments.txt"
         with open(complete_segments_path, "w") as out:
@@ -458,16 +1112,58 @@ def compile_complete_segments(segmented_accs, fa_dir, out_dir):
     return acc2taxon
 
 
-def output_list_fastas(fna_dir, out_path):
-    """Output a list of FASTA files"""
+def output_list_fastas(fna_dir, out_path, fnas=None):
+    """Output a list of FASTA files, defaulting to all in the directory"""
+    if fnas is None:
+        fnas = [x for x in os.listdir(fna_dir) if x.endswith(".fna")]
     with open(out_path, "w") as out:
-        for fna in os.listdir(fna_dir):
-            if fna.endswith(".fna"):
-                out.write(fna + "\n")
-
-
-def build_skani_db(fa_list, db_dir, threads=8):
-    """Build the SKANI database"""
+        for fna in fnas:
+            out.write(fna + "\n")
+
+
+def hash_fasta(fa_path):
+    """Hash the normalized sequences of a FASTA independent of header and
+    record order, so segmented assemblies match regardless of segment order"""
+    record_hashes = []
+    seq_hash = None
+    with open(fa_path, "rb") as fa_in:
+        # stream line by line; only a leading ">" starts a new record
+        for line in fa_in:
+            if line.startswith(b">"):
+                if seq_hash is not None:
+                    record_hashes.append(seq_hash.digest())
+                seq_hash = hashlib.sha1()
+            elif seq_hash is not None and not line.startswith(b"#"):
+                seq_hash.update(line.strip().upper())
+    if seq_hash is not None:
+        record_hashes.append(seq_hash.digest())
+    return hashlib.sha1(b"".join(sorted(record_hashes))).hexdigest()
+
+
+def dedup_fastas(fna_dir, fnas, threads=8):
+    """Collapse FASTAs with identical sequences to one representative,
+    preferring RefSeq accessions. Returns the representative FASTAs and a
+    map of each accession to its representative accession"""
+    with ThreadPoolExecutor(
+        max_workers=threads, thread_name_prefix=threading.current_thread().name
+    ) as executor:
+        hashes = executor.map(hash_fasta, [fna_dir + x for x in fnas])
+        hash2accs = defaultdict(list)
+        for fna, seq_hash in zip(fnas, hashes):
+            hash2accs[seq_hash].append(fna[:-4])
+
+    unique_fnas, acc2rep = [], {}
+    for accs in hash2accs.values():
+        rep_acc = min(accs, key=lambda x: (not x.startswith(REFSEQ_PREFIXES), x))
+        unique_fnas.append(rep_acc + ".fna")
+        for acc in accs:
+            acc2rep[acc] = rep_acc
+    return sorted(unique_fnas), acc2rep
+
+
+@instrument(output=lambda x: x["db_dir"])
+def build_skani_db(fa_list, db_dir, threads=8, cwd=None):
+    """Build the SKANI database, resolving the FASTA list relative to cwd"""
     # skani requires the output directory to not exist
     if os.path.isdir(db_dir):
         shutil.rmtree(db_dir)
@@ -489,31 +1185,76 @@ def build_skani_db(fa_list, db_dir, threads=8):
     #   with open(skani_file, 'w') as out:
     #      out.write(skani_cmd)
     try:
-        skani_exit = subprocess.call(skani_cmd)
+        skani_exit = subprocess.call(skani_cmd, cwd=cwd)
     except FileNotFoundError:
         raise FileNotFoundError("SKANI may not be installed")
     return skani_exit
 
 
-def push_to_gs_bucket(gs_bucket, file_path):
-    """Push a file to a Google Storage bucket"""
+def gsutil_cmd(args):
+    """Prefix gsutil arguments with the configured boto "-o" overrides"""
+    cmd = ["gsutil"]
+    for option in GSUTIL_OPTIONS:
+        cmd.extend(["-o", option])
+    return cmd + args
+
+
+def gs_crc32c(path):
+    """Return the base64 CRC32C of a local file or GS object, None if missing"""
+    if path.startswith("gs://"):
+        gs_args = ["stat", path]
+    else:
+        gs_args = ["hash", "-c", path]
+    gs_run = subprocess.run(
+        gsutil_cmd(gs_args), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    if gs_run.returncode:
+        return None
+    crc32c = re.search(r"Hash \(crc32c\):\s+(\S+)", gs_run.stdout.decode("utf-8"))
+    return crc32c[1] if crc32c else None
+
+
+def push_to_gs_bucket(gs_bucket, file_path, composite_threshold="150M"):
+    """Push a file to a Google Storage bucket, skipping unchanged objects.
+    Directories are synced by checksum; large files use parallel composite uploads"""
     if os.path.isdir(file_path):
-        gs_exit = subprocess.call(["gsutil", "-m", "cp", "-r", file_path, gs_bucket])
+        # rsync copies a directory's contents, whereas cp -r nests the directory
+        # under the destination, so keep the cp -r layout for consumers
+        dest = gs_bucket.rstrip("/") + "/" + os.path.basename(file_path.rstrip("/"))
+        gs_exit = subprocess.call(
+            gsutil_cmd(["-m", "rsync", "-c", "-r", file_path, dest])
+        )
     else:
-        gs_exit = subprocess.call(["gsutil", "-m", "cp", file_path, gs_bucket])
+        if not gs_bucket.endswith("/"):
+            local_crc = gs_crc32c(file_path)
+            if local_crc and local_crc == gs_crc32c(gs_bucket):
+                logger.info(f"{gs_bucket} is up to date, skipping upload")
+                return 0
+        gs_exit = subprocess.call(
+            gsutil_cmd(
+                [
+                    "-o",
+                    f"GSUtil:parallel_composite_upload_threshold={composite_threshold}",
+                    "cp",
+                    file_path,
+                    gs_bucket,
+                ]
+            )
+        )
     return gs_exit
 
 
-def rm_files(out_dir):
-    """Clean-up all the downloaded files"""
-    for path_ in os.listdir(out_dir):
+def rm_files(out_dir, keep=()):
+    """Clean-up all the downloaded files, except the names in keep"""
+    paths = [os.path.join(out_dir, x) for x in os.listdir(out_dir) if x not in keep]
+    for path_ in paths:
         if os.path.isfile(path_):
             os.remove(path_)
         elif os.path.isdir(path_):
             shutil.rmtree(path_)
 
 
-def skani_db_mngr(accs_path, out_dir, db_base, segmented_accs=None):
+def skani_db_mngr(accs_path, out_dir, db_base, segmented_accs=None, threads=8):
     """Download the viral genomes and build the SKANI database"""
     fna_dir = out_dir + "fna/"
     if not os.path.isdir(fna_dir):
@@ -530,8 +1271,16 @@ def skani_db_mngr(accs_path, out_dir, db_base, segmented_accs=None):
     logger.info("Extracting NCBI viral genomes from multifasta")
     multifas2fas(viral_fna, fna_dir)
 
+    # only sketch one genome per unique sequence set
+    logger.info("Collapsing genomes with identical sequences")
+    fnas = sorted(x for x in os.listdir(fna_dir) if x.endswith(".fna"))
+    unique_fnas, acc2rep = dedup_fastas(fna_dir, fnas, threads=threads)
+    logger.info(
+        f"Collapsed {len(fnas) - len(unique_fnas)} duplicate genomes, "
+        + f"{len(unique_fnas)} unique genomes remain"
+    )
     fa_list = f"{out_dir}fna_list.txt"
-    output_list_fastas(fna_dir, fa_list)
+    output_list_fastas(fna_dir, fa_list, unique_fnas)
 
     # build the SKANI database
     logger.info("Building SKANI database")
@@ -539,41 +1288,72 @@ def skani_db_mngr(accs_path, out_dir, db_base, segmented_accs=None):
     # can't exist prior to building db
     if os.path.isdir(skani_dir):
         shutil.rmtree(skani_dir)
-    cwd = os.getcwd()
-    os.chdir(fna_dir)
-    build_skani_db(fa_list, skani_dir, threads=8)
-    os.chdir(cwd)
+    build_skani_db(fa_list, skani_dir, threads=threads, cwd=fna_dir)
     skani_base = os.path.basename(skani_dir[:-1])
 
-    os.chdir(out_dir)
     logger.info("Compressing SkaniDB into tarchive")
-    skani_tar = compress_tarchive(skani_base)
+    skani_tar = compress_tarchive(out_dir + skani_base)
 
     acc2taxon_path = f"{out_dir}accession2taxon.tsv"
     with open(acc2taxon_path, "w") as out:
-        out.write("#accession\ttaxon\n")
+        # the representative is the accession sketched in the SKANI database
+        out.write("#accession\ttaxon\trepresentative\n")
         for acc in sorted(acc2taxon.keys()):
-            out.write(f"{acc}\t{acc2taxon[acc]}\n")
+            out.write(f"{acc}\t{acc2taxon[acc]}\t{acc2rep.get(acc, acc)}\n")
+    # indexed companion for lookups without parsing the whole table
+    acc2taxon_db = build_acc2taxon_db(
+        acc2taxon, f"{out_dir}accession2taxon.sqlite", acc2rep=acc2rep
+    )
+
+    return skani_tar, skani_base, fna_dir, acc2taxon_path, acc2taxon_db
+
 
-    return skani_tar, skani_base, fna_dir, acc2taxon_path
+def gunzip_file(gz_path, out_path, chunk_size=16 * 1024 * 1024):
+    """Decompress a gzipped file in binary blocks, using pigz when available.
+    The output may be a named pipe, in which case this blocks until it is read"""
+    pigz = shutil.which("pigz")
+    with open(out_path, "wb") as out:
+        if pigz:
+            subprocess.run([pigz, "-dc", gz_path], stdout=out, check=True)
+        else:
+            with gzip.open(gz_path, "rb") as gz_in:
+                shutil.copyfileobj(gz_in, out, chunk_size)
+    return out_path
 
 
-def prep_human_genome(human_genome_url, human_out_dir):
-    """Download the human genome and prepare it for Kraken2"""
+def prep_human_genome(human_genome_url, human_out_dir, segments=1, fifo=False):
+    """Download the human genome and prepare it for Kraken2.
+    If fifo is True, a named pipe is created in place of the decompressed
+    FASTA and the gzipped download is retained to stream through it"""
     human_genome_path = human_out_dir + os.path.basename(human_genome_url)
-    download_file(human_genome_url, human_genome_path)
-    with gzip.open(human_genome_path, "rt") as human_in:
-        human_out_path = re.sub(r".gz$", "", human_genome_path)
-        with open(human_out_path, "w") as human_out:
-            for line in human_in:
-                human_out.write(line)
+    download_file(
+        human_genome_url,
+        human_genome_path,
+        segments=segments,
+        checksum=ncbi_md5(human_genome_url),
+    )
+    human_out_path = re.sub(r".gz$", "", human_genome_path)
+    # a path left by a previous run in the other mode must be replaced: a regular
+    # file would be rewritten while read, and a FIFO would block the gunzip
+    is_fifo = os.path.lexists(human_out_path) and stat.S_ISFIFO(
+        os.lstat(human_out_path).st_mode
+    )
+    if os.path.lexists(human_out_path) and is_fifo != fifo:
+        os.remove(human_out_path)
+    if fifo:
+        if not is_fifo:
+            os.mkfifo(human_out_path)
+        return human_out_path, human_genome_path
+    gunzip_file(human_genome_path, human_out_path)
     os.remove(human_genome_path)
-    return human_out_path
-
+    return human_out_path, None
 
 
-def prep_kraken2_library(db_dir, human_genome_path, threads=4):
-    """Download the Kraken2 library for RefSeq viruses"""
+@instrument(output=lambda x: x["db_dir"])
+def prep_kraken2_library(db_dir, human_genome_path, threads=4, human_genome_gz=None):
+    """Download the Kraken2 library for RefSeq viruses.
+    If human_genome_gz is provided, human_genome_path is a named pipe that is
+    fed by decompressing human_genome_gz while k2 reads it"""
     download_cmd = [
         "k2",
         "download-library",
@@ -597,7 +1377,34 @@ def prep_kraken2_library(db_dir, human_genome_path, threads=4):
         "--threads",
         str(threads)
     ]
-    add_code = subprocess.call(add_cmd)
+    if human_genome_gz:
+        with ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=threading.current_thread().name
+        ) as executor:
+            gunzip_future = executor.submit(gunzip_file, human_genome_gz, human_genome_path)
+            add_code = subprocess.call(add_cmd)
+            # unblock the writer if k2 exited without draining the pipe
+            if not gunzip_future.done():
+                fifo_fd = os.open(human_genome_path, os.O_RDONLY | os.O_NONBLOCK)
+                try:
+                    while not gunzip_future.done():
+                        try:
+                            if os.read(fifo_fd, 16 * 1024 * 1024):
+                                continue
+                        except BlockingIOError:
+                            pass
+                        wait([gunzip_future], timeout=0.1)
+                finally:
+                    os.close(fifo_fd)
+            try:
+                gunzip_future.result()
+            except (OSError, subprocess.CalledProcessError) as e:
+                logger.error(f"Failed to stream {human_genome_gz} to k2: {e}")
+                add_code = add_code or 1
+        if add_code:
+            logger.error("Failed to add human genome to Kraken2 library via named pipe")
+    else:
+        add_code = subprocess.call(add_cmd)
     taxonomy_cmd = [
         "k2",
         "download-taxonomy",
@@ -607,6 +1414,7 @@ def prep_kraken2_library(db_dir, human_genome_path, threads=4):
     taxonomy_code = subprocess.call(taxonomy_cmd)
 
 
+@instrument(output=lambda x: x["db_dir"])
 def build_kraken2_db(db_dir, threads=8):
     """Build the Kraken2 database"""
     build_cmd = [
@@ -620,20 +1428,77 @@ def build_kraken2_db(db_dir, threads=8):
     build_code = subprocess.call(build_cmd)
 
 
-def build_bracken_db(db_dir, kmer_lens = [50, 75, 100, 150, 200, 250, 300], threads=8):
-    """Build the Bracken database from the Kraken2 database"""
-    for kmer_len in kmer_lens:
-        logger.info(f"Building Bracken database for kmer length: {kmer_len}")
-        build_cmd = [
-            "bracken-build",
-            "-d",
-            db_dir,
-            "-l",
-            str(kmer_len),
-            "-t",
-            str(threads),
-        ]
-        build_code = subprocess.call(build_cmd)
+def run_bracken_build(db_dir, read_len, threads=8):
+    """Run bracken-build for one read length and time it"""
+    logger.info(f"Building Bracken database for read length: {read_len}")
+    build_cmd = [
+        "bracken-build",
+        "-d",
+        db_dir,
+        "-l",
+        str(read_len),
+        "-t",
+        str(threads),
+    ]
+    start = time.time()
+    build_code = subprocess.call(build_cmd)
+    elapsed = time.time() - start
+    if build_code:
+        logger.error(f"bracken-build failed for read length {read_len}")
+    logger.info(
+        f"Bracken read length {read_len} built in {elapsed:.1f}s with {threads} threads"
+    )
+    return build_code, elapsed
+
+
+@instrument(output=lambda x: x["db_dir"])
+def build_bracken_db(
+    db_dir, kmer_lens=[50, 75, 100, 150, 200, 250, 300], threads=8, parallel=None
+):
+    """Build the Bracken database from the Kraken2 database.
+    The first read length runs alone with all threads to generate the shared
+    database.kraken classification, then the remaining read lengths run
+    concurrently with the thread budget split across them. Raises if any
+    read length fails"""
+    if not kmer_lens:
+        return {}
+    if parallel is None:
+        parallel = max(1, threads // 4)
+    parallel = max(1, min(parallel, len(kmer_lens) - 1))
+    build_threads = max(1, threads // parallel)
+
+    len2time = {}
+    build_code, len2time[kmer_lens[0]] = run_bracken_build(
+        db_dir, kmer_lens[0], threads=threads
+    )
+    # the remaining read lengths would race to regenerate database.kraken
+    if build_code:
+        raise Exception(
+            f"Bracken build failed for read length {kmer_lens[0]}, "
+            + "skipping the remaining read lengths"
+        )
+    failed = []
+    with ThreadPoolExecutor(
+        max_workers=parallel, thread_name_prefix=threading.current_thread().name
+    ) as executor:
+        futures = {
+            kmer_len: executor.submit(
+                run_bracken_build, db_dir, kmer_len, threads=build_threads
+            )
+            for kmer_len in kmer_lens[1:]
+        }
+        for kmer_len, future in futures.items():
+            build_code, len2time[kmer_len] = future.result()
+            if build_code:
+                failed.append(str(kmer_len))
+
+    logger.info(
+        "Bracken build wall times: "
+        + ", ".join(f"{k}: {v:.1f}s" for k, v in len2time.items())
+    )
+    if failed:
+        raise Exception(f"Bracken build failed for read lengths: {', '.join(failed)}")
+    return len2time
 
 
 def clean_kraken2_dir(db_path, dirty_files):
@@ -642,13 +1507,205 @@ def clean_kraken2_dir(db_path, dirty_files):
     clean_code = subprocess.call(clean_cmd)
     dirty_files.extend([x for x in os.listdir(db_path) if x.endswith('kraken')])
     for file_ in dirty_files:
-        if os.path.isfile(file_):
-            os.remove(file_)
-        elif os.path.isdir(file_):
+        if os.path.isdir(file_):
             shutil.rmtree(file_)
+        # includes named pipes
+        elif os.path.exists(file_):
+            os.remove(file_)
 
     
+def skani_stage(args, out_dir, upload_queue, threads=8):
+    """Build the SKANI database and queue its artifacts for upload"""
+    logger.info("Downloading latest viral nucleotide metadata")
+    viral_metadata_path = out_dir + "AllNuclMetadata.csv.gz"
+
+    # parse the metadata as it streams in and extract the complete non-SARS viral accessions
+    logger.info("Parsing viral metadata for non-SARS-CoV-2 accessions")
+    viral_accs_path, segmented_accs = parse_viral_metadata(
+        viral_metadata_path, out_dir, viral_metadata_url=args.viral_metadata_url
+    )
+
+    # create the sars dir and run
+    logger.info("Acquiring SARS-CoV-2 accessions")
+    sars_dir = out_dir + "sars-cov-2/"
+    if not os.path.isdir(sars_dir):
+        os.mkdir(sars_dir)
+
+    pango_json_path = sars_dir + "pangolin_lineages.json"
+    if not os.path.isfile(pango_json_path):
+        download_file(args.pangolin_json_url, pango_json_path)
+    pango_lineages = parse_pangolin_json(pango_json_path)
+    logger.info(
+        f"Finding up to {args.sars_accs_per_lineage * len(pango_lineages)} SARS-CoV-2 accessions"
+    )
+    sars_accs_path = lineage2accs(pango_lineages, sars_dir, args.sars_accs_per_lineage)
+
+    all_accs_path = out_dir + "all_accessions.txt"
+    with open(all_accs_path, "w") as out:
+        with open(viral_accs_path, "r") as viral_in:
+            out.write(viral_in.read().strip() + "\n")
+        with open(sars_accs_path, "r") as sars_in:
+            out.write(sars_in.read())
+
+    skani_tar, skani_base, fna_dir, acc2taxon_path, acc2taxon_db = skani_db_mngr(
+        all_accs_path,
+        out_dir,
+        "skani_db",
+        segmented_accs=segmented_accs,
+        threads=threads,
+    )
+
+    # not worth compressing because skani is already compressing
+    logger.info("Pushing SkaniDB to Google Storage")
+    # uploads run in the background, so paths cannot depend on the cwd
+    upload_queue.submit(os.path.join(out_dir, skani_tar), f"skani/{skani_base}.tar")
+    # upload the genome database
+    cur_date = datetime.now().strftime("%Y%m%d")
+    upload_queue.submit(fna_dir, f"skani/viral_fna_{cur_date}/")
+    upload_queue.submit(acc2taxon_path, f"skani/viral_fna_{cur_date}/viral_accession2taxon_{cur_date}.tsv")
+    upload_queue.submit(acc2taxon_db, f"skani/viral_fna_{cur_date}/viral_accession2taxon_{cur_date}.sqlite")
+
+
+def checkv_stage(args, out_dir, upload_queue, threads=1):
+    """Download and package the CheckV database"""
+    # download the CheckV database
+    checkv_dir = mk_output_dir(out_dir, "checkv_db")
+    subprocess.call(["checkv", "download_database", checkv_dir])
+    checkv_base = os.path.basename(checkv_dir[:-1])
+    logger.info("Compressing CheckV DB into tarchive")
+    checkv_upload = f"checkv/{checkv_base}.tar.gz"
+    # the archive streams to Google Storage while compressing when uploading
+    checkv_tar = compress_tarchive(
+        checkv_dir,
+        compression="gztar",
+        ext=".tar.gz",
+        threads=threads,
+        upload_uri=f"{args.gsbucket_url}{checkv_upload}" if args.upload else None,
+    )
+    if not args.upload:
+        upload_queue.submit(checkv_tar, checkv_upload)
+
+
+def kraken2_stage(args, out_dir, upload_queue, threads=8):
+    """Build and package the Kraken2 and Bracken databases"""
+    logger.info("Building Kraken2 database")
+    kraken_dir = mk_output_dir(out_dir, "k2_viral_refseq_GRCh38")
+    logger.debug("Downloading human genome for Kraken2 database")
+    human_genome_path, human_genome_gz = prep_human_genome(
+        args.human_genome_url,
+        kraken_dir,
+        segments=args.download_segments,
+        fifo=args.human_fifo,
+    )
+    if threads > 4:
+        download_threads = 4
+    else:
+        download_threads = threads
+    logger.info("Downloading Kraken2 viral library and adding human genome to library")
+    prep_kraken2_library(
+        kraken_dir,
+        human_genome_path,
+        threads=download_threads,
+        human_genome_gz=human_genome_gz,
+    )
+    logger.info("Building Kraken2 database")
+    build_kraken2_db(kraken_dir, threads=threads)
+    logger.info("Building Bracken k-mer libraries")
+    build_bracken_db(
+        kraken_dir, threads=threads, parallel=args.bracken_parallel
+    )
+    logger.info("Cleaning Kraken2 database directory")
+    dirty_files = [human_genome_path, 'estimated_capacity']
+    if human_genome_gz:
+        dirty_files.append(human_genome_gz)
+    clean_kraken2_dir(kraken_dir, dirty_files)
+    k2db_upload = "kraken2/k2_viral_refseq_GRCh38.tar.gz"
+    k2db_tar = compress_tarchive(
+        kraken_dir,
+        compression="gztar",
+        ext=".tar.gz",
+        threads=threads,
+        upload_uri=f"{args.gsbucket_url}{k2db_upload}" if args.upload else None,
+    )
+    if not args.upload:
+        upload_queue.submit(k2db_tar, k2db_upload)
+
+
+class StageLogFilter(logging.Filter):
+    """Pass records emitted by a stage thread and the workers it spawned"""
+
+    def __init__(self, stage_name):
+        super().__init__()
+        self.stage_name = stage_name
+
+    def filter(self, record):
+        return record.threadName == self.stage_name or record.threadName.startswith(
+            self.stage_name + "_"
+        )
+
+
+def run_stages(stages, cpu_budget, memory_budget, log_dir):
+    """Run independent stages concurrently within CPU and memory budgets.
+    Each stage is (name, function, threads, memory_gb) and the function is
+    called with threads=threads. Requests above a budget are clamped to it,
+    so an oversized stage waits and then runs alone. Each stage also logs to
+    <log_dir><name>.log"""
+    available = {"cpu": cpu_budget, "memory": memory_budget}
+    budget_cond = threading.Condition()
+    stage2error = {}
+
+    def run_stage(name, func, threads, memory_gb):
+        threads = min(threads, cpu_budget)
+        memory_gb = min(memory_gb, memory_budget)
+        handler = logging.FileHandler(f"{log_dir}{name}.log")
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        )
+        handler.addFilter(StageLogFilter(name))
+        logging.getLogger().addHandler(handler)
+        with budget_cond:
+            budget_cond.wait_for(
+                lambda: available["cpu"] >= threads
+                and available["memory"] >= memory_gb
+            )
+            available["cpu"] -= threads
+            available["memory"] -= memory_gb
+        logger.info(f"Starting {name} with {threads} threads and {memory_gb} GB")
+        start = time.time()
+        try:
+            with perf_record(f"{name}_stage"):
+                func(threads=threads)
+        except Exception as e:
+            logger.exception(f"{name} failed")
+            stage2error[name] = e
+        finally:
+            with budget_cond:
+                available["cpu"] += threads
+                available["memory"] += memory_gb
+                budget_cond.notify_all()
+            logger.info(f"Finished {name} in {time.time() - start:.1f}s")
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+
+    stage_threads = [
+        threading.Thread(target=run_stage, name=stage[0], args=stage)
+        for stage in stages
+    ]
+    for stage_thread in stage_threads:
+        stage_thread.start()
+    for stage_thread in stage_threads:
+        stage_thread.join()
+    if stage2error:
+        raise Exception(f"Failed stages: {', '.join(sorted(stage2error))}")
+
+
+def total_memory_gb():
+    """Return the total physical memory in GB"""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024**3
+
+
 def main():
+    start = time.time()
     max_threads = os.cpu_count() * 2
     if max_threads > 16:
         max_threads = 16
@@ -683,9 +1740,44 @@ def main():
         default=max_threads,
         help=f"Number of threads to use (DEFAULT: max_threads)",
     )
+    parser.add_argument(
+        "--bracken_parallel",
+        type=int,
+        help="Concurrent Bracken read length builds (DEFAULT: threads // 4)",
+    )
+    parser.add_argument(
+        "--human_fifo",
+        help="Stream the decompressed human genome to k2 through a named pipe",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--download_segments",
+        type=int,
+        default=1,
+        help="Parallel ranged segments for large downloads (DEFAULT: 1)",
+    )
     parser.add_argument("-o", "--output_dir", help="Output directory")
 
 
+    parser.add_argument(
+        "--memory_gb",
+        type=float,
+        default=total_memory_gb(),
+        help="Memory budget in GB for concurrent database builds (DEFAULT: total memory)",
+    )
+    parser.add_argument(
+        "--upload_workers",
+        type=int,
+        default=4,
+        help="Concurrent Google Storage uploads (DEFAULT: 4)",
+    )
+    parser.add_argument(
+        "--gsutil_option",
+        action="append",
+        default=[],
+        help="Boto config override passed to gsutil -o, e.g. for a local GCS emulator; repeatable",
+    )
+
     url_parser = parser.add_argument_group()
     url_parser.add_argument(
         "-b",
@@ -728,92 +1820,76 @@ def main():
         out_dir = format_path(args.output_dir)
         if not os.path.isdir(out_dir):
             os.mkdir(out_dir)
+            # add the directory ending now that it exists
+            out_dir = format_path(out_dir)
     else:
         # build an output directory
         out_dir = mk_output_dir(os.getcwd(), "update_theiaviral_dbs")
 
-    # download latest viral metadata
-    if not args.skani_skip:
-        logger.info("Downloading latest viral nucleotide metadata")
-        viral_metadata_path = out_dir + "AllNuclMetadata.csv.gz"
-        download_file(args.viral_metadata_url, viral_metadata_path)
-
-        # parse the metadata and extract the complete non-SARS viral accessions
-        logger.info("Parsing viral metadata for non-SARS-CoV-2 accessions")
-        viral_accs_path, segmented_accs = parse_viral_metadata(
-            viral_metadata_path, out_dir
-        )
-
-        # create the sars dir and run
-        logger.info("Acquiring SARS-CoV-2 accessions")
-        sars_dir = out_dir + "sars-cov-2/"
-        if not os.path.isdir(sars_dir):
-            os.mkdir(sars_dir)
-
-        pango_json_path = sars_dir + "pangolin_lineages.json"
-        if not os.path.isfile(pango_json_path):
-            download_file(args.pangolin_json_url, pango_json_path)
-        pango_lineages = parse_pangolin_json(pango_json_path)
-        logger.info(
-            f"Finding up to {args.sars_accs_per_lineage * len(pango_lineages)} SARS-CoV-2 accessions"
-        )
-        sars_accs_path = lineage2accs(pango_lineages, sars_dir, args.sars_accs_per_lineage)
+    GSUTIL_OPTIONS.extend(args.gsutil_option)
+    upload_queue = UploadQueue(
+        args.gsbucket_url, upload=args.upload, workers=args.upload_workers
+    )
 
-        all_accs_path = out_dir + "all_accessions.txt"
-        with open(all_accs_path, "w") as out:
-            with open(viral_accs_path, "r") as viral_in:
-                out.write(viral_in.read().strip() + "\n")
-            with open(sars_accs_path, "r") as sars_in:
-                out.write(sars_in.read())
+    # split the thread budget so the stages can run side by side,
+    # giving Kraken2 whatever SKANI and CheckV do not reserve
+    checkv_threads = max(1, args.threads // 8)
+    if args.kraken_skip:
+        skani_threads = max(1, args.threads - checkv_threads)
+    else:
+        skani_threads = max(1, args.threads // 4)
+    reserved_threads = 0
+    if not args.skani_skip:
+        reserved_threads += skani_threads
+    if not args.checkv_skip:
+        reserved_threads += checkv_threads
+    kraken_threads = max(1, args.threads - reserved_threads)
 
-        skani_tar, skani_base, fna_dir, acc2taxon_path = skani_db_mngr(
-            all_accs_path, out_dir, "skani_db", segmented_accs=segmented_accs
+    stages = []
+    if not args.skani_skip:
+        stages.append(
+            (
+                "skani",
+                partial(skani_stage, args, out_dir, upload_queue),
+                skani_threads,
+                STAGE_MEMORY_GB["skani"],
+            )
         )
-
-        # not worth compressing because skani is already compressing
-        logger.info("Pushing SkaniDB to Google Storage")
-        upload_mngr(skani_tar, f"skani/{skani_base}.tar", args.gsbucket_url, upload=args.upload)
-        # upload the genome database
-        cur_date = datetime.now().strftime("%Y%m%d")
-        upload_mngr(fna_dir, f"skani/viral_fna_{cur_date}/", args.gsbucket_url, upload=args.upload)
-        upload_mngr(acc2taxon_path, f"skani/viral_fna_{cur_date}/viral_accession2taxon_{cur_date}.tsv", args.gsbucket_url, upload=args.upload)
-
-
     if not args.checkv_skip:
-        # download the CheckV database
-        checkv_dir = mk_output_dir(out_dir, "checkv_db")
-        subprocess.call(["checkv", "download_database", checkv_dir])
-        checkv_base = os.path.basename(checkv_dir)
-        logger.info("Compressing CheckV DB into tarchive")
-        checkv_tar = compress_tarchive(checkv_base, compression="gztar", ext=".tar.gz")
-        logger.info("Pushing CheckV DB to Google Storage")
-        upload_mngr(checkv_tar, f"checkv/{checkv_base}.tar.gz", args.gsbucket_url, upload=args.upload)
-
-
+        stages.append(
+            (
+                "checkv",
+                partial(checkv_stage, args, out_dir, upload_queue),
+                checkv_threads,
+                STAGE_MEMORY_GB["checkv"],
+            )
+        )
     if not args.kraken_skip:
-        logger.info("Building Kraken2 database")
-        kraken_dir = mk_output_dir(out_dir, "k2_viral_refseq_GRCh38")
-        logger.debug("Downloading human genome for Kraken2 database")
-        human_genome_path = prep_human_genome(args.human_genome_url, kraken_dir)
-        if args.threads > 4:
-            download_threads = 4
-        else:
-            download_threads = args.threads
-        logger.info("Downloading Kraken2 viral library and adding human genome to library")
-        prep_kraken2_library(kraken_dir, human_genome_path, threads=download_threads)
-        logger.info("Building Kraken2 database")
-        build_kraken2_db(kraken_dir, threads=args.threads)
-        logger.info("Building Bracken k-mer libraries")
-        build_bracken_db(kraken_dir, threads=args.threads)
-        logger.info("Cleaning Kraken2 database directory")
-        clean_kraken2_dir(kraken_dir, [human_genome_path, 'estimated_capacity'])
-        k2db_tar = compress_tarchive(kraken_dir, compression="gztar", ext=".tar.gz")
-        upload_mngr(k2db_tar, f"kraken2/k2_viral_refseq_GRCh38.tar.gz", args.gsbucket_url, upload=args.upload)
+        stages.append(
+            (
+                "kraken2",
+                partial(kraken2_stage, args, out_dir, upload_queue),
+                kraken_threads,
+                STAGE_MEMORY_GB["kraken2"],
+            )
+        )
+    # the logs and performance report are kept through clean-up for comparing runs
+    log_dir = out_dir + "logs/"
+    report_path = out_dir + "performance_report.json"
+    if not os.path.isdir(log_dir):
+        os.mkdir(log_dir)
+    try:
+        run_stages(stages, args.threads, args.memory_gb, log_dir)
 
+        logger.info("Waiting for queued uploads to finish")
+        with perf_record("upload_wait"):
+            upload_queue.wait()
+    finally:
+        write_perf_report(report_path, start, args.threads)
 
     if args.upload:
         logger.info("Cleaning up")
-        rm_files(out_dir)
+        rm_files(out_dir, keep=("logs", "performance_report.json"))
 
 
 if __name__ == "__main__":